@@ -1,7 +1,7 @@
 import discord
 from discord.ext import commands
 from app.constants import status_codes as stc
-from app.utils import checks, embed
+from app.utils import checks, embed, utils
 
 class Admin(commands.Cog):
     def __init__(self, bot):
@@ -18,7 +18,7 @@ class Admin(commands.Cog):
         """Configure or view settings for the league"""
 
         if ctx.invoked_subcommand is None:
-            settings = self.bot.db.get_config(ctx.message.guild)
+            settings = await self.bot.db.get_config(ctx.message.guild)
             emsg = embed.info(title="League Configuration")
             for setting in settings:
                 if setting != "_id":
@@ -35,7 +35,7 @@ class Admin(commands.Cog):
         """Sets the league admin role to the mentioned role.
         League admins can audit, accept, and remove matches."""
 
-        self.bot.db.set_admin_role(role.name, ctx.message.guild)
+        await self.bot.db.set_admin_role(role.name, ctx.message.guild)
         await ctx.send(embed=embed.success(description=f"**SUCCESS** - {role.mention} set to league admin"))
 
     @config.command(
@@ -55,9 +55,9 @@ class Admin(commands.Cog):
         thresh_t = args[0]
         value = int(args[1])
         if thresh_t == "player":
-            self.bot.db.set_player_match_threshold(value, ctx.message.guild)
+            await self.bot.db.set_player_match_threshold(value, ctx.message.guild)
         elif thresh_t == "deck":
-            self.bot.db.set_deck_match_threshold(value, ctx.message.guild)
+            await self.bot.db.set_deck_match_threshold(value, ctx.message.guild)
         else:
             await ctx.send(embed=embed.error(description="Unrecognized threshold type."))
             return
@@ -89,12 +89,13 @@ class Admin(commands.Cog):
         user = ctx.message.mentions[0]
         nupdates = len(game_ids)
         for i in range(nupdates):
-            deck = self.bot.db.find_deck(deck_names[i])
+            deck, suggestions = await self.bot.db.resolve_deck(deck_names[i])
             if not deck:
                 await ctx.send(embed=embed.error(
-                    description=f"Deck name \"{deck_names[i]}\" not recognized. See `{ctx.prefix}decks` for a list of all decks."))
+                    description=f"Deck name \"{deck_names[i]}\" not recognized." + utils.did_you_mean(suggestions) \
+                        + f" See `{ctx.prefix}decks` for a list of all decks."))
                 continue
-            if not self.bot.db.confirm_match_for_user(game_ids[i], user.id, deck['name'], ctx.message.guild):
+            if not await self.bot.db.confirm_match_for_user(game_ids[i], user.id, deck['name'], ctx.message.guild):
                 await ctx.send(embed=embed.error(
                     description=f"No game found for `{game_ids[i]}` with the given user as a participant."
                 ))
@@ -118,15 +119,15 @@ class Admin(commands.Cog):
         if not game_id:
             await ctx.send(embed=embed.error(description="No game id specified"))
             return
-        match = self.bot.db.find_match(game_id, ctx.message.guild)
+        match = await self.bot.db.find_match(game_id, ctx.message.guild)
         if not match:
             await ctx.send(embed=embed.error(description=f"`{game_id}` does not exist"))
             return
         if match["status"] == stc.ACCEPTED:
             return
 
-        self.bot.db.confirm_match_for_users(game_id, ctx.message.guild)
-        delta = self.bot.db.check_match_status(game_id, ctx.message.guild)
+        await self.bot.db.confirm_match_for_users(game_id, ctx.message.guild)
+        delta = await self.bot.db.check_match_status(game_id, ctx.message.guild)
         if delta:
             await ctx.send(embed=embed.match_delta(game_id, delta))
 
@@ -144,7 +145,7 @@ class Admin(commands.Cog):
         if not game_id:
             await ctx.send(embed=embed.error(description="No game id specified"))
             return
-        match = self.bot.db.find_match(game_id, ctx.message.guild)
+        match = await self.bot.db.find_match(game_id, ctx.message.guild)
         if not match:
             await ctx.send(embed=embed.error(description=f"`{game_id}` does not exist"))
             return
@@ -155,7 +156,7 @@ class Admin(commands.Cog):
             await ctx.send(embed=embed.error(description="Only a league admin or the match winner can remove a match"))
             return
 
-        self.bot.db.delete_match(game_id, ctx.message.guild)
+        await self.bot.db.delete_match(game_id, ctx.message.guild)
         await ctx.send(embed=embed.msg(description=f"`{game_id}` has been removed"))
 
 
@@ -176,7 +177,7 @@ class Admin(commands.Cog):
         game_id = args[0]
         replay_link = args[1]
 
-        if not self.bot.db.update_match(
+        if not await self.bot.db.update_match(
             {"game_id": game_id},
             {"$set": {"replay_link": replay_link}},
             ctx.message.guild):
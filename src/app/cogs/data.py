@@ -1,24 +1,24 @@
+import asyncio
 import discord
 from discord.ext import commands
 import logging
 import re
-from functools import reduce
 
-from app.constants import status_codes as stc
 from app.constants import system
 from app.utils import checks, embed, line_table, table, utils
 
 DEFAULT_LIMIT = 10
+MATCHUP_LIMIT = 20
 
 class Data(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
 
-    def _get_game_ids_list(self, matches):
-        if not matches.count():
+    def _get_game_ids_list(self, game_ids):
+        if not game_ids:
             return "N/A"
-        return "\n".join([f"`{match['game_id']}`" for match in matches])
+        return "\n".join([f"`{game_id}`" for game_id in game_ids])
 
 
     @commands.group(
@@ -29,20 +29,15 @@ class Data(commands.Cog):
     async def info(self, ctx):
         """Show summary info of the league. Displays the number of registered players, the number of games recorded, and pending and disputed matches."""
 
-        num_accepted = self.bot.db.count_matches({"status": stc.ACCEPTED}, ctx.message.guild)
-        season_info = self.bot.db.get_season(ctx.message.guild)
-        num_season_accepted = self.bot.db.count_matches({"status": stc.ACCEPTED, "timestamp": {"$gte":season_info['start_time']}}, ctx.message.guild)
-        num_members = self.bot.db.members(ctx.message.guild).count()
-        disputed_matches = self.bot.db.find_matches({"status": stc.DISPUTED}, ctx.message.guild)
-        pending_matches = self.bot.db.find_matches({"status": stc.PENDING}, ctx.message.guild)
-        disputed = self._get_game_ids_list(disputed_matches)
-        pending = self._get_game_ids_list(pending_matches)
+        summary = await self.bot.db.get_league_summary(ctx.message.guild)
+        disputed = self._get_game_ids_list(summary["disputed"])
+        pending = self._get_game_ids_list(summary["pending"])
 
         emsg = embed.info(title=f"{ctx.message.guild.name} League") \
-                    .add_field(name="Players", value=str(num_members)) \
-                    .add_field(name="Current Season", value=str(season_info['season_number'])) \
-                    .add_field(name="Total Games Played", value=str(num_accepted)) \
-                    .add_field(name="Games Played This Season", value=str(num_season_accepted)) \
+                    .add_field(name="Players", value=str(summary["members"])) \
+                    .add_field(name="Current Season", value=str(summary["season_number"])) \
+                    .add_field(name="Total Games Played", value=str(summary["accepted"])) \
+                    .add_field(name="Games Played This Season", value=str(summary["season_accepted"])) \
                     .add_field(name="Pending Games", value=pending) \
                     .add_field(name="Disputed Games", value=disputed) 
 
@@ -63,7 +58,7 @@ class Data(commands.Cog):
 
         if ctx.invoked_subcommand is None:
             limit = utils.DEFAULT_LIMIT
-            players = self.bot.db.find_top_members_by("points", ctx.message.guild, limit=limit)
+            players = await self.bot.db.find_top_members_by("points", ctx.message.guild, limit=limit)
             print(players)
             if not players:
                 await ctx.send(embed=embed.info(description="No players found with enough games played."))
@@ -77,7 +72,7 @@ class Data(commands.Cog):
         if (type(limit) is not int):
             await ctx.send(embed=embed.error(description="Limit should be a number."))
             raise ValueError
-        DEFAULT_THRESHOLD = self.bot.db.get_player_match_threshold(ctx.message.guild)
+        DEFAULT_THRESHOLD = await self.bot.db.get_player_match_threshold(ctx.message.guild)
         min_games = utils.get_command_arg(args, "min", DEFAULT_THRESHOLD)
         if (type(min_games) is not int):
             await ctx.send(embed=embed.error(description="Min should be a number."))
@@ -99,7 +94,7 @@ class Data(commands.Cog):
             limit, min_games = await self.get_top_args(ctx, args)
         except ValueError:
             return
-        players = self.bot.db.find_top_members_by("wins", ctx.message.guild, limit=limit, threshold=min_games)
+        players = await self.bot.db.find_top_members_by("wins", ctx.message.guild, limit=limit, threshold=min_games)
         if not players:
             await ctx.send(embed=embed.info(description="No players found with enough games played."))
             return
@@ -122,7 +117,7 @@ class Data(commands.Cog):
             limit, min_games = await self.get_top_args(ctx, args)
         except ValueError:
             return
-        players = self.bot.db.find_top_members_by("winrate", ctx.message.guild, limit=limit, threshold=min_games)
+        players = await self.bot.db.find_top_members_by("winrate", ctx.message.guild, limit=limit, threshold=min_games)
         if not players:
             await ctx.send(embed=embed.info(description="No players found with enough games played."))
             return
@@ -145,7 +140,7 @@ class Data(commands.Cog):
             limit, min_games = await self.get_top_args(ctx, args)
         except ValueError:
             return
-        players = self.bot.db.find_top_members_by("accepted", ctx.message.guild, limit=limit, threshold=min_games)
+        players = await self.bot.db.find_top_members_by("accepted", ctx.message.guild, limit=limit, threshold=min_games)
         if not players:
             await ctx.send(embed=embed.info(description="No players found with enough games played."))
             return
@@ -169,7 +164,7 @@ class Data(commands.Cog):
             limit, min_games = await self.get_top_args(ctx, args)
         except ValueError:
             return
-        players = self.bot.db.find_top_members_by("points", ctx.message.guild, limit=limit, threshold=min_games)
+        players = await self.bot.db.find_top_members_by("points", ctx.message.guild, limit=limit, threshold=min_games)
         if not players:
             await ctx.send(embed=embed.info(description="No players found with enough games played."))
             return
@@ -244,20 +239,18 @@ class Data(commands.Cog):
     def _make_full_deck_player_tables(self, data, deck_name):
         """Makes a table displaying a deck's results for every player hat has piloted it."""
 
-        flattened_data = reduce(utils.player_accumulator, data, {"deck_name": deck_name, "data": {}})["data"]
-        if not flattened_data:
+        if not data:
             return None
         headings = ["Name", "Wins", "Losses", "Win %", "Games"]
         rows = [
             [
-                flattened_data[player]['name'],
-                str(flattened_data[player]['wins']),
-                str(flattened_data[player]['losses']),
-                f"{flattened_data[player]['wins']/flattened_data[player]['games']:.1%}",
-                str(flattened_data[player]['games'])
-            ] for player in flattened_data
+                player['name'],
+                str(player['wins']),
+                str(player['losses']),
+                f"{player['wins']/player['games']:.1%}",
+                str(player['games'])
+            ] for player in data
         ]
-        rows.sort(key=lambda o: int(o[1]), reverse=True)
         height = 10
         _tables = [
             str(table.Table(title=f"{deck_name} Stats by Player", columns=headings, rows=rows[i:i+height]))
@@ -292,7 +285,7 @@ class Data(commands.Cog):
         # Display only the selected stat and the sample size
         # Leave detail statistical analysis in the deck info command
         if not ctx.message.mentions:
-            data = utils.get_match_stats(ctx)
+            data = await utils.get_match_stats(ctx)
         else:
             await self.display_player_deck_stats(ctx, sort_key)
             return
@@ -310,9 +303,9 @@ class Data(commands.Cog):
 
         # Check if the sort_key is a deck name
         # If it is a deck name, get deckstats by player for that deck
-        deck = self.bot.db.find_deck(sort_key)
+        deck = await self.bot.db.find_deck(sort_key)
         if deck:
-            data = self.bot.db.find_matches_with_deck(deck["name"], ctx.message.guild, limit=0, season=None)
+            data = await self.bot.db.find_deck_pilot_stats(deck, ctx.message.guild)
             _tables = self._make_full_deck_player_tables(data, deck["name"])
             if not _tables:
                 await ctx.send(embed=embed.info(description="No matches found with the given deck"))
@@ -342,10 +335,10 @@ class Data(commands.Cog):
     async def display_player_deck_stats(self, ctx, sort_key):
         sort_key = sort_key.split()[0]
         user = ctx.message.mentions[0]
-        if not self.bot.db.find_member(user.id, ctx.message.guild):
+        if not await self.bot.db.find_member(user.id, ctx.message.guild):
             await ctx.send(embed=embed.error(f"**{user.name}** is not a registered player"))
             return
-        data = utils.get_player_match_stats(ctx, user)
+        data = await utils.get_player_match_stats(ctx, user)
         if not data:
             await ctx.send(embed=embed.error(description=f"No matches found for **{user.name}**"))
             return
@@ -365,18 +358,68 @@ class Data(commands.Cog):
         for _table in _tables.text:
             await ctx.send(_table)
 
+    @commands.command(
+        brief="Show how decks fare against each other",
+        usage=("`{0}matchups`\n" \
+               "`{0}matchups [deck name]`"
+        )
+    )
+    @commands.guild_only()
+    async def matchups(self, ctx, *, deck_name: str=""):
+        """Displays how decks perform when they share a pod. If a deck name is given, show that deck's win % against every deck it has met. Otherwise, show the most frequent pairings and each side's win %. Only pairings with at least as many games as the deck match threshold are shown."""
+
+        guild = ctx.message.guild
+        matrix, threshold = await asyncio.gather(
+            self.bot.db.get_matchups(guild), self.bot.db.get_deck_match_threshold(guild))
+        if deck_name:
+            deck = await self.bot.db.find_deck(deck_name)
+            if not deck:
+                await ctx.send(embed=embed.error(description=f"{deck_name} is not a recognized deck."))
+                return
+            opponents = matrix.against(deck["name"], min_games=threshold) if deck["name"] in matrix else []
+            if not opponents:
+                await ctx.send(embed=embed.info(description=f"No matchups found for **{deck['name']}**"))
+                return
+            short_names = await self.bot.db.get_deck_short_names([name for name, _, _ in opponents])
+            rows = [
+                [short_names[name] or name, f"{wins/games:.1%}", str(games)]
+                for name, games, wins in opponents
+            ]
+            _table = line_table.LineTable(rows, title=f"{deck['name']} Matchups", headers=["VS", "WIN %", "GAMES"])
+        else:
+            pairings = matrix.pairings(min_games=threshold, limit=MATCHUP_LIMIT)
+            if not pairings:
+                await ctx.send(embed=embed.info(description="No matchups found with enough matches"))
+                return
+            short_names = await self.bot.db.get_deck_short_names(
+                [name for pairing in pairings for name in pairing[:2]])
+            rows = [
+                [
+                    f"{short_names[deck_a] or deck_a} v {short_names[deck_b] or deck_b}",
+                    f"{wins_a/games:.0%}-{wins_b/games:.0%}",
+                    str(games)
+                ] for deck_a, deck_b, games, wins_a, wins_b in pairings
+            ]
+            _table = line_table.LineTable(rows, title="Most Frequent Matchups", headers=["DECKS", "WIN %", "GAMES"])
+        for text in _table.text:
+            await ctx.send(text)
+
 
-    def _make_match_table(self, title, matches, winner_type="player"):
+    async def _make_match_table(self, title, matches, winner_type="player"):
         header = "`DATE` `ID` `REPLAY` `WINNER`\n"
         rows = []
         max_name_len = 16
+        if winner_type == "deck":
+            long_names = {
+                match['winning_deck'] for match in matches
+                if match['winning_deck'] and len(match['winning_deck']) > max_name_len
+            }
+            short_names = await self.bot.db.get_deck_short_names(long_names) if long_names else {}
         for match in matches:
             date = utils.short_date_from_timestamp(match['timestamp'])
             if winner_type == "deck":
                 deck_name = match['winning_deck'] if match['winning_deck'] else "N/A"
-                if len(deck_name) > max_name_len:
-                    deck_name = self.bot.db.get_deck_short_name(deck_name)
-                winner = deck_name
+                winner = short_names.get(deck_name) or deck_name
             else:
                 winner = utils.get_winner_name(match)
                 winner = utils.shorten_player_name(winner)
@@ -399,8 +442,8 @@ class Data(commands.Cog):
         """Displays a list of filtered games. If no filter type is included, the most recent 10 games will be displayed. If filtered by decks, include a comma-separated list of decks that the games should contain. If filtered by players, mention all players that the games should contain."""
 
         if ctx.invoked_subcommand is None:
-            matches = self.bot.db.find_matches({}, ctx.message.guild, limit=10)
-            emsgs = self._make_match_table('Recent Games', matches, winner_type="player")
+            matches = await self.bot.db.find_matches({}, ctx.message.guild, limit=10)
+            emsgs = await self._make_match_table('Recent Games', matches, winner_type="player")
             for emsg in emsgs:
                 await ctx.send(embed=emsg)
             return
@@ -422,23 +465,27 @@ class Data(commands.Cog):
             await ctx.send(embed=embed.error(ctx, description="Games cannot contain more than 4 decks"))
             return
 
-        deck_names = []
+        decks = []
         for deck_name in deck_name_list:
-            deck = self.bot.db.find_deck(deck_name)
+            deck, suggestions = await self.bot.db.resolve_deck(deck_name)
             if not deck:
+                if suggestions:
+                    await ctx.send(embed=embed.info(
+                        description=f"{deck_name.strip()} is not a recognized deck." + utils.did_you_mean(suggestions)))
                 continue
-            deck_names.append(deck['name'])
+            decks.append(deck)
 
-        if not deck_names:
+        if not decks:
             await ctx.send(embed=embed.error(ctx, description="No decks found with the given deck names"))
             return
-        matches = self.bot.db.find_matches({"players.deck": {"$all": deck_names}}, ctx.message.guild, limit=20)
-        matches = list(matches)
+        deck_names = [deck['name'] for deck in decks]
+        query = {"$and": [self.bot.db.deck_match_query(deck) for deck in decks]}
+        matches = await self.bot.db.find_matches(query, ctx.message.guild, limit=20)
         if not matches:
             await ctx.send(embed=embed.info(description=("No matches found containing " + ", ".join(deck_names))))
             return
         title = "Games Containing: " + ", ".join(deck_names)
-        emsgs = self._make_match_table(title, matches, winner_type="deck")
+        emsgs = await self._make_match_table(title, matches, winner_type="deck")
         for emsg in emsgs:
             await ctx.send(embed=emsg)
         
@@ -457,17 +504,16 @@ class Data(commands.Cog):
             return
         if len(mentions) == 0:
             mentions.append(ctx.message.author)
-        matches = self.bot.db.find_matches(
+        matches = await self.bot.db.find_matches(
             {"players.user_id": {"$all": [user.id for user in mentions]}},
             ctx.message.guild,
             limit=20
         )
-        matches = list(matches)
         if not matches:
             await ctx.send(embed=embed.info(description=("No matches found containing " + ", ".join([user.name for user in mentions]))))
             return
         title = "Games Containing: " + ", ".join([mention.name for mention in mentions])
-        emsgs = self._make_match_table(title, matches, winner_type="player")
+        emsgs = await self._make_match_table(title, matches, winner_type="player")
         for emsg in emsgs:
             await ctx.send(embed=emsg)
 
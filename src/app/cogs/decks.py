@@ -33,15 +33,15 @@ class Decks(commands.Cog):
         if deck_name.lower() == "rogue":
             official_name = "Rogue"
         else:
-            deck = self.bot.db.find_deck(deck_name)
+            deck, suggestions = await self.bot.db.resolve_deck(deck_name)
             if not deck:
-                emsg = embed.error(description=f"{deck_name} is not a recognized deck.") \
+                emsg = embed.error(description=f"{deck_name} is not a recognized deck." + utils.did_you_mean(suggestions)) \
                             .add_field(name="Actions", value=action_description)
                 await ctx.send(embed=emsg)
                 return
             else:
                 official_name = deck["name"]
-        self.bot.db.set_deck(official_name, user, ctx.message.guild)
+        await self.bot.db.set_deck(official_name, user, ctx.message.guild)
         await ctx.send(embed=embed.msg(description=f"Deck set to {official_name} for **{user.name}**"))
 
 
@@ -56,13 +56,8 @@ class Decks(commands.Cog):
 
         if not color:
             emsg = embed.msg(title="Registered Decks")
-            colors = utils.get_all_color_combinations()
-            for color in colors:
-                example = self.bot.db.find_one_deck_by_color(color)
-                if not example:
-                    continue
-                decks = self.bot.db.find_decks_by_color(color)
-                emsg.add_field(name=example["color_name"], value=(
+            for _, decks in await self.bot.db.find_decks_grouped_by_color():
+                emsg.add_field(name=decks[0]["color_name"], value=(
                     "\n".join([deck["name"] for deck in decks])
                 ))
                 if (len(emsg.fields) == 9):
@@ -71,13 +66,12 @@ class Decks(commands.Cog):
             if len(emsg.fields) > 0:
                 await ctx.send(embed=emsg)
         else:
-            example = self.bot.db.find_one_deck_by_color(color)
-            if not example:
+            decks = await self.bot.db.find_decks_by_color(color)
+            if not decks:
                 await ctx.send(embed=embed.error(description="No decks found with the specified color combination."))
             else:
-                decks = self.bot.db.find_decks_by_color(color)
                 emsg = embed.msg(
-                    title=f"Registered {example['color_name']} Decks",
+                    title=f"Registered {decks[0]['color_name']} Decks",
                     description=("\n".join(deck["name"] for deck in decks))
                 )
                 await ctx.send(embed=emsg)
@@ -90,7 +84,7 @@ class Decks(commands.Cog):
             return None
 
         try:
-            deck = deck_utils.extract(link)
+            deck = await deck_utils.extract(link)
         except err.DeckNotFoundError:
             await ctx.send(embed=embed.error(description="Failed to fetch decklist from the given link."))
             return None
@@ -111,7 +105,7 @@ class Decks(commands.Cog):
             await ctx.send(embed=embed.error(description="No deck name specified."))
             return
 
-        deck = self.bot.db.find_deck(deck_name)
+        deck = await self.bot.db.find_deck(deck_name)
         if not deck:
             await ctx.send(embed=embed.error(
                 description=f"Deck not found. Use `{ctx.prefix}decks` to see a list of decks."))
@@ -136,25 +130,25 @@ class Decks(commands.Cog):
             emsg.add_field(name=f"{category_name} ({count})", value="\n".join(cards))
         await ctx.send(embed=emsg)
 
-    def _make_match_row(self, match, deck_name):
+    def _make_match_row(self, match, deck):
         return [
             datetime.fromtimestamp(match['timestamp']).strftime("%Y-%m-%d"),
             match['game_id'],
-            'WIN' if match['winning_deck'] == deck_name else 'LOSE'
+            'WIN' if utils.is_deck(deck, match['winning_deck'], match.get('winning_deck_id')) else 'LOSE'
         ]
 
-    def _make_match_history_table(self, matches, deck_name):
-        rows = [self._make_match_row(match, deck_name) for match in matches]
+    def _make_match_history_table(self, matches, deck):
+        rows = [self._make_match_row(match, deck) for match in matches]
         return line_table.LineTable(rows).text[0]
 
 
-    def _get_match_stats(self, ctx, matches, deck_name):
+    async def _get_match_stats(self, ctx, matches, deck):
         match_stats = {}
         total_appearances = sum(
-            [utils.get_appearances(match, deck_name) for match in matches])
-        total_deck_wins = self.bot.db.count_matches(
-            {"winning_deck": deck_name}, ctx.message.guild)
-        total_matches = self.bot.db.count_matches(
+            [utils.get_appearances(match, deck) for match in matches])
+        total_deck_wins = await self.bot.db.count_matches(
+            self.bot.db.deck_match_query(deck, winning=True), ctx.message.guild)
+        total_matches = await self.bot.db.count_matches(
             {"timestamp": {"$gt":system.deck_tracking_start_date}}, ctx.message.guild)
         if total_appearances > 1:
             meta_percent = total_appearances/(total_matches*4)
@@ -184,21 +178,19 @@ class Decks(commands.Cog):
         if not deck_name:
             await ctx.send(embed=embed.error(description="No deck name specified"))
             return
-        deck = self.bot.db.find_deck(deck_name)
+        deck = await self.bot.db.find_deck(deck_name)
         if not deck:
             await ctx.send(embed=embed.error(description=f"{deck_name} was not found"))
             return
-        matches = list(self.bot.db.find_matches(
-            {"players.deck": deck['name']}, ctx.message.guild))
-        match_stats = self._get_match_stats(ctx, matches, deck['name'])
+        matches = await self.bot.db.find_matches(
+            self.bot.db.deck_match_query(deck), ctx.message.guild)
+        match_stats = await self._get_match_stats(ctx, matches, deck)
         if matches:
             match_history = self._make_match_history_table(
-                matches[:5], deck['name'])
+                matches[:5], deck)
         else:
             match_history = "`N/A`"
         
-        card = scryfall.search(deck['commanders'][0])
-        image_uris = scryfall.get_image_uris(card)
         emsg = embed.info(title=f"Deck: {deck['name']}") \
                     .add_field(name="Commanders", value=("\n".join(deck['commanders']))) \
                     .add_field(name="Aliases", value=("\n".join(deck['aliases']))) \
@@ -208,8 +200,13 @@ class Decks(commands.Cog):
                     .add_field(name="Losses", value=match_stats['losses']) \
                     .add_field(name="Win %", value=match_stats['winrate']) \
                     .add_field(name="95% Confidence Interval", value=match_stats['confint']) \
-                    .add_field(name="Recent Matches", value=match_history) \
-                    .set_thumbnail(url=image_uris['small'])
+                    .add_field(name="Recent Matches", value=match_history)
+        try:
+            card = await scryfall.search(deck['commanders'][0])
+        except err.CardNotFoundError:
+            pass
+        else:
+            emsg.set_thumbnail(url=scryfall.get_image_uris(card)['small'])
         await ctx.send(embed=emsg)
 
 def setup(bot):
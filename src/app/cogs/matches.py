@@ -12,7 +12,7 @@ class Matches(commands.Cog):
 
     async def _are_players_registered(self, ctx, players):
         for user in players:
-            if not self.bot.db.find_member(user.id, ctx.message.guild):
+            if not await self.bot.db.find_member(user.id, ctx.message.guild):
                 await ctx.send(embed=embed.error(description=f"**{user.name}** is not a registered player"))
                 return False
         return True
@@ -44,7 +44,7 @@ class Matches(commands.Cog):
         if not await self._has_enough_players(ctx, players):
             return
 
-        game_id = self.bot.db.add_match(ctx, winner, players)
+        game_id = await self.bot.db.add_match(ctx, winner, players)
         player_mentions = " ".join([player.mention for player in players])
         emsg = embed.msg(
             title=f'Game id: {game_id}',
@@ -93,9 +93,9 @@ class Matches(commands.Cog):
     async def _get_player_confirmation(self, ctx, player, game_id):
         if not await self._confirm_deck(ctx, player, game_id):
             return None
-        self.bot.db.confirm_match_for_user(game_id, ctx.message.author.id, player["deck"], ctx.message.guild)
+        await self.bot.db.confirm_match_for_user(game_id, ctx.message.author.id, player["deck"], ctx.message.guild)
         await ctx.send(embed=embed.success(description=f"Recieved confirmation from **{ctx.message.author.name}**"))
-        return self.bot.db.check_match_status(game_id, ctx.message.guild)
+        return await self.bot.db.check_match_status(game_id, ctx.message.guild)
 
 
     @commands.command(
@@ -112,14 +112,14 @@ class Matches(commands.Cog):
         Confirmation is a two-step process to verify the caller's deck choice and then to verify that the match result is correct."""
 
         user = ctx.message.author
-        member = self.bot.db.find_member(user.id, ctx.message.guild)
+        member = await self.bot.db.find_member(user.id, ctx.message.guild)
         if not member["pending"]:
             await ctx.send(embed=embed.info(description="No pending matches to confirm"))
             return
         if not game_id:
             game_id = member["pending"][-1]
 
-        match = self.bot.db.find_match(game_id, ctx.message.guild)
+        match = await self.bot.db.find_match(game_id, ctx.message.guild)
         if not match:
             await ctx.send(embed=embed.error(description=f"`{game_id}` does not exist"))
             return
@@ -146,7 +146,7 @@ class Matches(commands.Cog):
         """Dispute a match result. This will notify league admins that the match result requires attention. League admins may resolve the match by either accepting or removing it. If you created the match and there is an error (ie. mentioned the wrong players), then the `remove` command is more appropriate to undo the logged match and log the correct result."""
 
         user = ctx.message.author
-        member = self.bot.db.find_member(user.id, ctx.message.guild)
+        member = await self.bot.db.find_member(user.id, ctx.message.guild)
         if not member["pending"]:
             await ctx.send(embed=embed.info(description="No pending matches to deny"))
             return
@@ -154,7 +154,7 @@ class Matches(commands.Cog):
             await ctx.send(embed=embed.error(description="You must specify a game id to dispute it"))
             return
 
-        match = self.bot.db.find_match(game_id, ctx.message.guild)
+        match = await self.bot.db.find_match(game_id, ctx.message.guild)
         if not match:
             await ctx.send(embed=embed.error(description=f"`{game_id}` does not exist"))
             return
@@ -168,21 +168,22 @@ class Matches(commands.Cog):
         elif match["status"] == stc.DISPUTED:
             await ctx.send(embed=embed.info(description="This match has already been marked for review"))
         else:
-            self.bot.db.set_match_status(stc.DISPUTED, game_id, ctx.message.guild)
-            self.bot.db.unconfirm_match_for_user(game_id, user.id, ctx.message.guild)
-            admin_role = self.bot.db.get_admin_role(ctx.message.guild)
+            await self.bot.db.set_match_status(stc.DISPUTED, game_id, ctx.message.guild)
+            await self.bot.db.unconfirm_match_for_user(game_id, user.id, ctx.message.guild)
+            admin_role = await self.bot.db.get_admin_role(ctx.message.guild)
             mention = "" if not admin_role else admin_role.mention
             await ctx.send(embed=embed.msg(
                 description=f"{mention} Match `{game_id}` has been marked as **disputed**")
             )
 
 
-    def _make_game_table(self, ctx, match):
+    async def _make_game_table(self, ctx, match):
         headers = ["PLAYER", "DECK", " "]
+        short_names = await utils.shorten_deck_names(ctx, [player["deck"] for player in match['players']], maxlen=16)
         rows = [
             [
                 player['name'],
-                utils.shorten_deck_name(ctx, player["deck"], maxlen=16) if player["deck"] else "N/A",
+                short_names[player["deck"]] if player["deck"] else "N/A",
                 "☑" if player["confirmed"] else "☐"
             ] for player in match['players']
         ]
@@ -201,7 +202,7 @@ class Matches(commands.Cog):
         if not game_id:
             await ctx.send(embed=embed.error(description="No game id specified"))
             return
-        match = self.bot.db.find_match(game_id, ctx.message.guild)
+        match = await self.bot.db.find_match(game_id, ctx.message.guild)
         if not match:
             await ctx.send(embed=embed.error(description=f"`{game_id}` does not exist"))
             return
@@ -222,7 +223,7 @@ class Matches(commands.Cog):
         if match['replay_link']:
             emsg.add_field(name="Replay", value=match['replay_link'])
         
-        emsg.description = self._make_game_table(ctx, match)
+        emsg.description = await self._make_game_table(ctx, match)
         await ctx.send(embed=emsg)
 
     async def _find_user(self, user_id):
@@ -239,11 +240,11 @@ class Matches(commands.Cog):
         """Send an alert to each player to confirm your pending matches.
         This will pull your list of pending matches and mention all players in each match that has not yet confirmed the result."""
 
-        member = self.bot.db.find_member(ctx.message.author.id, ctx.message.guild)
+        member = await self.bot.db.find_member(ctx.message.author.id, ctx.message.guild)
         if not member["pending"]:
             await ctx.send(embed=embed.msg(description="You have no pending matches"))
             return
-        pending_matches = self.bot.db.find_matches({"game_id": {"$in": member["pending"]}}, ctx.message.guild)
+        pending_matches = await self.bot.db.find_matches({"game_id": {"$in": member["pending"]}}, ctx.message.guild)
         for match in pending_matches:
             unconfirmed = [
                 await self.bot.get_user_info(player["user_id"]) for player in match["players"] 
@@ -7,7 +7,6 @@ from app.utils import checks, embed, line_table, table, utils
 class Members(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.favorite_deck_window = 10
 
 
     @commands.command(
@@ -20,7 +19,7 @@ class Members(commands.Cog):
             
         user = ctx.message.author
         guild = ctx.message.guild
-        if self.bot.db.add_member(user, guild):
+        if await self.bot.db.add_member(user, guild):
             emsg = embed.msg(
                 description = "Registered **{}** to the {} league".format(user.name, guild.name)
             )
@@ -31,13 +30,10 @@ class Members(commands.Cog):
         await ctx.send(embed=emsg)
 
 
-    def _get_favorite_deck(self, player, guild):
-        player_id = player["user_id"]
-        matches = self.bot.db.find_user_matches(player_id, guild, limit=self.favorite_deck_window)
+    def _get_favorite_deck(self, player):
         decks = {}
-        for match in matches:
-            player = next((i for i in match["players"] if i["user_id"] == player_id), None)
-            deck_name = player["deck"]
+        # most recent first so that ties go to the deck played last
+        for deck_name in reversed(player.get("recent_decks", [])):
             if deck_name and deck_name in decks:
                 decks[deck_name] += 1
             else:
@@ -48,10 +44,11 @@ class Members(commands.Cog):
         return None
 
 
-    def _add_favorite_deck_field(self, emsg, player, guild):
+    def _add_favorite_deck_field(self, emsg, player):
         if "deck" in player and player["deck"]:
-            favorite_deck = self._get_favorite_deck(player, guild)
-            emsg.add_field(name="Favorite Deck", value=favorite_deck)
+            favorite_deck = self._get_favorite_deck(player)
+            if favorite_deck:
+                emsg.add_field(name="Favorite Deck", value=favorite_deck)
 
 
     def _add_last_played_deck_field(self, emsg, player):
@@ -69,20 +66,14 @@ class Members(commands.Cog):
         if len(badges) > 0:
             emsg.add_field(name="Season Badges", value=badges)
 
-    def _get_profile_card(self, user, guild):
-        player = self.bot.db.find_member(user.id, guild)
+    async def _get_profile_card(self, user, guild):
+        player = await self.bot.db.find_member(user.id, guild)
         if not player:
             return None
 
         # update username if the username changed
         if player["name"] != user.name:
-            self.bot.db.members(guild).update_one({
-                "user_id": user.id
-            }, {
-                "$set": {
-                    "name": user.name
-                }
-            })
+            await self.bot.db.set_member_name(user.id, user.name, guild)
         win_percent = 100*player["wins"]/player["accepted"] if player["accepted"] else 0.0
         emsg = embed.info(title=user.name) \
                     .set_thumbnail(url=utils.get_avatar(user)) \
@@ -90,7 +81,7 @@ class Members(commands.Cog):
                     .add_field(name="Wins", value=str(player["wins"])) \
                     .add_field(name="Losses", value=str(player["losses"])) \
                     .add_field(name="Win %", value="{:.3f}%".format(win_percent))
-        self._add_favorite_deck_field(emsg, player, guild)
+        self._add_favorite_deck_field(emsg, player)
         self._add_last_played_deck_field(emsg, player)
         self._add_season_badges(emsg, player)
         return emsg
@@ -107,7 +98,7 @@ class Members(commands.Cog):
 
         users = utils.get_target_users(ctx)
         for user in users:
-            profile_card = self._get_profile_card(user, ctx.message.guild)
+            profile_card = await self._get_profile_card(user, ctx.message.guild)
             if not profile_card:
                 emsg = embed.error(
                     description = "**{}** is not a registered player".format(user.name)
@@ -128,7 +119,7 @@ class Members(commands.Cog):
 
         user = ctx.message.author
         guild = ctx.message.guild
-        player = self.bot.db.find_member(user.id, guild)
+        player = await self.bot.db.find_member(user.id, guild)
         if not player["pending"]:
             emsg = embed.msg(description="You have no pending, unconfirmed matches.")
             await ctx.send(embed=emsg)
@@ -143,15 +134,16 @@ class Members(commands.Cog):
         await ctx.send(embed=emsg)
 
 
-    def _make_match_tables(self, ctx, user, matches):
+    async def _make_match_tables(self, ctx, user, matches):
         title = "{}'s Match History".format(user.name)
         headers = ["DATE", "ID", "DECK", "RESULT"]
         max_name_len = 15
         rows = []
-        for match in matches:
+        deck_names = [utils.get_player_deck(user.id, match) for match in matches]
+        short_names = await utils.shorten_deck_names(ctx, deck_names, maxlen=max_name_len)
+        for match, deck_name in zip(matches, deck_names):
             date = utils.short_date_from_timestamp(match['timestamp'])
-            deck_name = utils.get_player_deck(user.id, match)
-            deck_name = utils.shorten_deck_name(ctx, deck_name, maxlen=max_name_len)
+            deck_name = short_names[deck_name]
             result = "WIN" if match['winner'] == user.id else "LOSE"
             rows.append([date, match['game_id'], deck_name, result])
         _line_table = line_table.LineTable(rows, title=title, headers=headers)
@@ -174,13 +166,13 @@ class Members(commands.Cog):
 
         users = utils.get_target_users(ctx)
         for user in users:
-            if not self.bot.db.find_member(user.id, ctx.message.guild):
+            if not await self.bot.db.find_member(user.id, ctx.message.guild):
                 continue
-            matches = self.bot.db.find_user_matches(user.id, ctx.message.guild, limit=limit)
+            matches = await self.bot.db.find_user_matches(user.id, ctx.message.guild, limit=limit)
             if not matches:
                 await ctx.send(embed=embed.info(description=f"No matches found for **{user.name}**"))
                 continue
-            _line_table = self._make_match_tables(ctx, user, matches)
+            _line_table = await self._make_match_tables(ctx, user, matches)
             for _table in _line_table.text:
                 await ctx.send(_table)
     
@@ -208,22 +200,13 @@ class Members(commands.Cog):
         if len(mentions) > 4:
             await ctx.send(embed=embed.error(description="Too many players mentioned"))
             return
-        matches = self.bot.db.find_matches(
-            {"players.user_id": {"$all": [user.id for user in mentions]}},
-            ctx.message.guild
-        )
-        matches = list(matches)
-        total = len(matches)
+        head_to_head = await self.bot.db.find_head_to_head(
+            [user.id for user in mentions], ctx.message.guild)
+        total = head_to_head["games"]
         if not total:
             await ctx.send(embed=embed.info(description="No matches found containing all mentioned players"))
             return
-        data = {user.name: 0 for user in mentions}
-        for match in matches:
-            winner = next((user.name for user in mentions if user.id == match['winner']), None)
-            if not winner:
-                continue
-            if winner in data:
-                data[winner] += 1
+        data = {user.name: head_to_head["wins"][user.id] for user in mentions}
         players = ", ".join(data.keys())
         emsg = embed.info(title=f"Games Containing: {players}")
         emsg.add_field(name="Total Matches", inline=False, value=str(total))
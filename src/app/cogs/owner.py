@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import discord
 from discord.ext import commands
 import json
 import random
 from app.constants import color_names
 from app import exceptions as err
-from app.utils import checks, embed
+from app.utils import checks, database, embed
 from app.utils.deckhosts import deck_utils
 
 class OwnerCog(commands.Cog):
@@ -99,7 +100,7 @@ class OwnerCog(commands.Cog):
         """Add a user to the database."""
 
         guild = ctx.message.guild
-        if self.bot.db.add_member(user, guild):
+        if await self.bot.db.add_member(user, guild):
             emsg = embed.msg(
                 description = f"Registered **{user.name}** to the {guild.name} league"
             )
@@ -135,12 +136,12 @@ class OwnerCog(commands.Cog):
             return
         winner = users[random.randint(0,3)]
         
-        game_id = self.bot.db.add_match(ctx, winner, users)
+        game_id = await self.bot.db.add_match(ctx, winner, users)
         deck_names = self._load_deck_names("../config/decks.json")
         for user in users:
             rand_deck = self._get_random_deck(deck_names)
-            self.bot.db.confirm_match_for_user(game_id, user.id, rand_deck, guild)
-        delta = self.bot.db.check_match_status(game_id, guild)
+            await self.bot.db.confirm_match_for_user(game_id, user.id, rand_deck, guild)
+        delta = await self.bot.db.check_match_status(game_id, guild)
         if delta:
             await ctx.send(embed=embed.success(description=f'**SUCCESS** - Added {game_id}'))
 
@@ -164,7 +165,7 @@ class OwnerCog(commands.Cog):
         deck_name = args[0]
         deck_link = args[1]
         try:
-            deck = deck_utils.extract(deck_link)
+            deck = await deck_utils.extract(deck_link)
         except err.DeckNotFoundError:
             await ctx.send(embed=embed.error(description=f'**ERROR** - Failed to fetch decklist from link'))
             return
@@ -172,7 +173,7 @@ class OwnerCog(commands.Cog):
             await ctx.send(embed=embed.error(description=f'**ERROR** - Failed to fetch commanders from Scryfall'))
             return
         color_name = color_names.NAMES[deck["color_identity"]]
-        self.bot.db.add_deck(
+        await self.bot.db.add_deck(
             deck["color_identity"],
             color_name,
             deck_name,
@@ -197,11 +198,11 @@ class OwnerCog(commands.Cog):
 
         deck_name = args[0]
         aliases = args[1:]
-        deck = self.bot.db.find_deck(deck_name)
+        deck = await self.bot.db.find_deck(deck_name)
         if not deck:
             await ctx.send(embed=embed.error(description='**ERROR** - Deck not found'))
             return
-        response = self.bot.db.add_deck_aliases(deck_name, aliases)
+        response = await self.bot.db.add_deck_aliases(deck_name, aliases)
         if not response:
             await ctx.send(embed=embed.error(description='**ERROR** - No aliases added'))
         else:
@@ -221,13 +222,13 @@ class OwnerCog(commands.Cog):
 
         deck_name = args[0]
         deck_link = args[1]
-        deck = self.bot.db.find_deck(deck_name)
+        deck = await self.bot.db.find_deck(deck_name)
         if not deck:
             await ctx.send(embed=embed.error(description='**ERROR** - Deck not found'))
             return
 
         try:
-            decklist = deck_utils.extract(deck_link)
+            decklist = await deck_utils.extract(deck_link)
         except err.DeckNotFoundError:
             await ctx.send(embed=embed.error(description='**ERROR** - Failed to fetch deck from the given link'))
             return
@@ -235,25 +236,30 @@ class OwnerCog(commands.Cog):
             await ctx.send(embed=embed.error(description='**ERROR** - Failed to fetch commander from Scryfall'))
             return
 
-        self.bot.db.add_deck_link(deck_name, deck_link)
+        await self.bot.db.add_deck_link(deck_name, deck_link)
         await ctx.send(embed=embed.success(description=f"**SUCCESS** - Added a link for **{deck['name']}**"))
         
 
-    def _load_decks(self):
+    async def _load_decks(self):
         with open("../config/decks.json", "r") as infile:
             decks = json.load(infile)
-        decks_added = 0
-        for category in decks:
-            for deck in category["decks"]:
-                decks_added += self.bot.db.add_deck(
-                    category["colors"], 
-                    category["color_name"],
-                    deck["name"],
-                    deck["aliases"],
-                    deck["commanders"],
-                    deck["link"]
-                )
-        return decks_added
+        # a deck entry can name the deck it used to be with "renamed_from"; the old name stays
+        # on as an alias so that it still resolves
+        documents = [
+            database.make_deck(
+                category["colors"],
+                category["color_name"],
+                deck["name"],
+                deck["aliases"] + [deck["renamed_from"]] if "renamed_from" in deck else deck["aliases"],
+                deck["commanders"],
+                deck.get("link", "")
+            ) for category in decks for deck in category["decks"]
+        ]
+        renames = {
+            deck["name"]: deck["renamed_from"]
+            for category in decks for deck in category["decks"] if "renamed_from" in deck
+        }
+        return await self.bot.db.sync_decks(documents, renames)
 
 
     @commands.command(
@@ -265,13 +271,51 @@ class OwnerCog(commands.Cog):
     async def _rescan_decks(self, ctx):
         """Scans the decks.json file in config/ and imports the decks into the database."""
 
-        decks_added = self._load_decks()
-        if not decks_added:
+        report = await self._load_decks()
+        if not report["inserted"] and not report["renamed"] and not report["updated"]:
             await ctx.send(embed=embed.info(
-                description=f"Nothing new to import"))
+                description=f"Nothing new to import ({report['unchanged']} deck(s) unchanged)"))
         else:
-            await ctx.send(embed=embed.success(
-                description=f"**SUCCESS** - {decks_added} new deck(s) imported"))
+            await ctx.send(embed=embed.success(description=(
+                f"**SUCCESS** - {report['inserted']} new deck(s) imported, {report['renamed']} renamed, "
+                + f"{report['updated']} updated, "
+                + f"{report['unchanged']} unchanged. Deck catalog is now at version {report['version']}"
+            )))
+
+    @commands.command(
+        name="rebuild-stats", hidden=True,
+        brief="Rebuild the league's deck stats",
+        usage="`{0}rebuild-stats`"
+    )
+    @commands.guild_only()
+    @commands.check(checks.is_super_admin)
+    async def _rebuild_stats(self, ctx):
+        """Recomputes the stored deck stats for this league from its full match history. Use this to backfill the stats after matches have been edited directly in the database."""
+
+        await self.bot.db.rebuild_stats(ctx.message.guild)
+        await ctx.send(embed=embed.success(description="**SUCCESS** - Rebuilt deck stats"))
+
+    @commands.command(
+        name="indexes", hidden=True,
+        brief="Report missing and unused indexes",
+        usage="`{0}indexes`"
+    )
+    @commands.is_owner()
+    async def _index_report(self, ctx):
+        """Creates any missing indexes in every guild database and reports which indexes were missing and which have not been used since the database started."""
+
+        guilds = self.bot.guilds
+        reports = await asyncio.gather(*[self.bot.db.reconcile_indices(guild) for guild in guilds])
+        emsg = embed.info(title="Index Report")
+        for guild, report in zip(guilds, reports):
+            created = "\n".join(report["missing"]) if report["missing"] else "None"
+            unused = "\n".join(report["unused"]) if report["unused"] else "None"
+            emsg.add_field(name=guild.name, inline=False, value=f"**Created**\n{created}\n**Unused**\n{unused}")
+            if (len(emsg.fields) == 9):
+                await ctx.send(embed=emsg)
+                emsg = embed.info(title="Index Report")
+        if len(emsg.fields) > 0:
+            await ctx.send(embed=emsg)
 
     @commands.command(
         name='remove-deck', hidden=True,
@@ -290,7 +334,7 @@ class OwnerCog(commands.Cog):
             return
 
         deck_name = args[0]
-        response = self.bot.db.remove_deck(deck_name)
+        response = await self.bot.db.remove_deck(deck_name)
         if not response:
             await ctx.send(embed=embed.error(description=f'**ERROR** - Failed to remove {deck_name}'))
             return
@@ -19,7 +19,7 @@ class Seasons(commands.Cog):
     async def season(self, ctx, *, season_number: int = None):
         """Get information about a season."""
 
-        season_info = self.bot.db.get_season(ctx.message.guild, season=season_number)
+        season_info = await self.bot.db.get_season(ctx.message.guild, season=season_number)
         if not season_info:
             await ctx.send(embed=embed.error(description=f"Season {season_number} does not exist."))
             return
@@ -32,7 +32,7 @@ class Seasons(commands.Cog):
             emsg.add_field(name="End Date", value=end_date.strftime("%Y-%m-%d"))
             awards = [emojis.first_place, emojis.second_place, emojis.third_place]
             emsg.add_field(name="Season Awards", value="\n".join(
-                [f"`{awards[i]} - {self.bot.db.find_member(user_id, ctx.message.guild)['name']}`" 
+                [f"`{awards[i]} - {(await self.bot.db.find_member(user_id, ctx.message.guild))['name']}`" 
                 for i, user_id in enumerate(season_info["season_leaders"])]
                 )
             )
@@ -49,20 +49,20 @@ class Seasons(commands.Cog):
         """End the current season and start a new season. Season awards will be given out to the top 3 players."""
 
         # Display end-of-season stats for the top 10 players for points and games played
-        players = self.bot.db.find_top_members_by("points", ctx.message.guild, limit=10)
+        players = await self.bot.db.find_top_members_by("points", ctx.message.guild, limit=10)
         points_tables = utils.make_leaderboard_table(players, 'points', 'Top Players by Points')
         if points_tables is not None:
             for _table in points_tables.text:
                 await ctx.send(_table)
 
-        players = self.bot.db.find_top_members_by("accepted", ctx.message.guild, limit=10)
+        players = await self.bot.db.find_top_members_by("accepted", ctx.message.guild, limit=10)
         played_tables = utils.make_leaderboard_table(players, 'accepted', 'Top Players by Games Played')
         if played_tables is not None:
             for _table in played_tables.text:
                 await ctx.send(_table)
 
         # Rollover to the new season
-        last_season_number, season_leaders = self.bot.db.reset_season(ctx.message.guild)
+        last_season_number, season_leaders = await self.bot.db.reset_season(ctx.message.guild)
         awards = [emojis.first_place, emojis.second_place, emojis.third_place]
         emsg = embed.success(description=f"Season {last_season_number} has ended.")
         if season_leaders:
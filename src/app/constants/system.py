@@ -5,4 +5,7 @@ deck_tracking_start_date = 1529132400
 min_matches = 10
 
 # number of points a player starts with in a season
-base_points = 1000
\ No newline at end of file
+base_points = 1000
+
+# number of recent matches used to pick a player's favorite deck
+recent_decks_window = 10
@@ -1,15 +1,68 @@
+import asyncio
 from discord.ext import commands
 import hashids
+import logging
 
+from app.utils import card_cache
+from app.utils import card_index
 from app.utils import database
 from app.utils import embed
+from app.utils import http
+from app.utils import scryfall
+
+# game ids have always been shown in lowercase, so they are encoded with lowercase characters only
+GAME_ID_ALPHABET = "abcdefghijklmnopqrstuvwxyz1234567890"
 
 class RankBot(commands.Bot):
     def setup_config(self, config):
         self._config = config
-        self.db = database.RankDB(config["mongodb_host"], config["mongodb_port"])
-        self.hasher = hashids.Hashids(salt="cEDH league")
+        # on_ready fires again after every reconnect, but the startup work only needs to run once
+        self._started = False
+        self.db = database.RankDB(
+            config["mongodb_host"], config["mongodb_port"],
+            transactions=config.get("mongodb_transactions", False),
+            match_store_budget=config.get("match_store_memory_mb", 0)*1024*1024
+        )
+        self.hasher = hashids.Hashids(salt="cEDH league", alphabet=GAME_ID_ALPHABET)
         self._super_admins = set(config["super_admin_ids"])
+        scryfall.set_card_cache(card_cache.CardCache(
+            config.get("scryfall_cache_path", "scryfall.db"),
+            ttl=config.get("scryfall_cache_ttl_days", 7)*24*60*60
+        ))
+        if config.get("scryfall_bulk_data"):
+            scryfall.set_card_index(card_index.open_index(
+                config.get("scryfall_index_path", "cards.db"), config["scryfall_bulk_data"]
+            ))
+
+    async def on_ready(self):
+        if self._started:
+            return
+        self._started = True
+        await self.db.migrate_deck_ids()
+        await self.db.load_deck_catalog()
+        for guild, report in await self._for_each_guild("Index reconciliation", self.db.reconcile_indices):
+            if report["missing"]:
+                logging.info(f"Created missing indices for {guild.name}: {', '.join(report['missing'])}")
+            if report["unused"]:
+                logging.info(f"Unused indices for {guild.name}: {', '.join(report['unused'])}")
+        for guild, count in await self._for_each_guild("Deck id migration", self.db.migrate_match_deck_ids):
+            if count:
+                logging.info(f"Recorded deck ids on {count} matches for {guild.name}")
+        await self._for_each_guild("Stats backfill", self.db.backfill_stats)
+
+    async def _for_each_guild(self, step, work):
+        """Runs work for every guild concurrently. A failure is logged for its guild alone, so
+        it cannot hold back the other guilds or the later steps. Returns (guild, result) for
+        the guilds that succeeded."""
+
+        results = await asyncio.gather(*[work(guild) for guild in self.guilds], return_exceptions=True)
+        succeeded = []
+        for guild, result in zip(self.guilds, results):
+            if isinstance(result, Exception):
+                logging.error(f"{step} failed for {guild.name}", exc_info=result)
+            else:
+                succeeded.append((guild, result))
+        return succeeded
 
     async def on_guild_join(self, guild):
         emsg = embed.msg(description=(
@@ -17,7 +70,11 @@ class RankBot(commands.Bot):
             + "admin using `set_admin [role name]`"
         ))
         await guild.owner.send(embed=emsg)
-        self.db.setup_indices(guild)
+        await self.db.setup_indices(guild)
+
+    async def close(self):
+        await http.close()
+        await super().close()
 
     def is_super_admin(self, user_snowflake):
         return user_snowflake in self._super_admins
@@ -0,0 +1,61 @@
+import asyncio
+import concurrent.futures
+import json
+import sqlite3
+import time
+
+from app.utils import fuzzy
+
+DEFAULT_TTL = 7*24*60*60
+
+class CardCache():
+    """SQLite-backed store of Scryfall cards keyed by normalized card name. Each entry holds
+    the fields the bot reads from a card, with image URIs already resolved, and the time it
+    was fetched so stale entries can be refreshed. Reads and writes run on a single worker
+    thread that owns the connection, keeping disk I/O off the event loop."""
+
+    def __init__(self, path=":memory:", ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        # the connection is created here but only used on the worker thread from now on
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cards ("
+            "key TEXT PRIMARY KEY, card TEXT NOT NULL, fetched_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    async def _run(self, function, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, function, *args)
+
+    async def get(self, card_name):
+        """Returns (card, fresh) for a cached card name, or (None, False) if it was never cached."""
+
+        return await self._run(self._get, card_name)
+
+    async def put(self, card_name, card):
+        """Caches card under both the name it was searched by and its full name."""
+
+        await self._run(self._put, card_name, card)
+
+    def _get(self, card_name):
+        row = self._conn.execute(
+            "SELECT card, fetched_at FROM cards WHERE key = ?", (fuzzy.normalize(card_name),)
+        ).fetchone()
+        if not row:
+            return None, False
+        return json.loads(row[0]), time.time() - row[1] < self.ttl
+
+    def _put(self, card_name, card):
+        keys = {fuzzy.normalize(card_name), fuzzy.normalize(card["name"])}
+        value = json.dumps(card)
+        fetched_at = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO cards (key, card, fetched_at) VALUES (?, ?, ?)",
+            [(key, value, fetched_at) for key in keys]
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._conn.close()
@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+import sqlite3
+
+from app.utils import fuzzy, scryfall
+
+# minimum similarity for a fuzzy name match to be trusted over asking Scryfall
+FUZZY_MATCH_THRESHOLD = 0.8
+
+class CardIndex():
+    """Local card index built from a Scryfall bulk-data file. Lookups accept the same loose
+    names as the cards/named?fuzzy= endpoint: exact names, face names of multi-faced cards,
+    unambiguous name prefixes and near misses."""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS cards ("
+            "oracle_id TEXT PRIMARY KEY, name TEXT NOT NULL, "
+            "color_identity TEXT NOT NULL, image_uris TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS names ("
+            "key TEXT PRIMARY KEY, oracle_id TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+        )
+        self._fuzzy = None
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM cards").fetchone()[0]
+
+    def built_from(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'source_mtime'").fetchone()
+        return float(row[0]) if row else None
+
+    def ingest(self, bulk_path):
+        """Replaces the index with the cards in a Scryfall bulk-data file. The oracle_cards
+        export is the intended input; with larger exports the first printing of each card wins."""
+
+        with open(bulk_path, "r", encoding="utf-8") as infile:
+            bulk = json.load(infile)
+        cards = []
+        names = []
+        for card in bulk:
+            if "oracle_id" not in card:
+                continue
+            try:
+                image_uris = scryfall.get_image_uris(card)
+            except KeyError:
+                continue
+            cards.append((
+                card["oracle_id"], card["name"],
+                json.dumps(card["color_identity"]), json.dumps(image_uris)
+            ))
+            face_names = [card["name"]] + [face["name"] for face in card.get("card_faces", [])]
+            names += [(fuzzy.normalize(name), card["oracle_id"]) for name in face_names]
+        with self._conn:
+            self._conn.execute("DELETE FROM cards")
+            self._conn.execute("DELETE FROM names")
+            self._conn.executemany("INSERT OR IGNORE INTO cards VALUES (?, ?, ?, ?)", cards)
+            self._conn.executemany("INSERT OR IGNORE INTO names VALUES (?, ?)", names)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('source_mtime', ?)", (str(os.path.getmtime(bulk_path)),)
+            )
+        self._fuzzy = None
+        logging.info(f"Indexed {len(cards)} cards from {bulk_path}")
+
+    def _load_fuzzy(self):
+        self._fuzzy = fuzzy.TrigramIndex()
+        for key, oracle_id in self._conn.execute("SELECT key, oracle_id FROM names"):
+            self._fuzzy.add(key, oracle_id)
+
+    def _find_oracle_id(self, key):
+        row = self._conn.execute("SELECT oracle_id FROM names WHERE key = ?", (key,)).fetchone()
+        if row:
+            return row[0]
+        rows = self._conn.execute(
+            "SELECT DISTINCT oracle_id FROM names WHERE key > ? AND key < ? LIMIT 2", (key, key + "\uffff")
+        ).fetchall()
+        if len(rows) == 1:
+            return rows[0][0]
+        if self._fuzzy is None:
+            self._load_fuzzy()
+        matches = self._fuzzy.search(key, limit=1)
+        if matches and matches[0][1] >= FUZZY_MATCH_THRESHOLD:
+            return matches[0][0]
+        return None
+
+    def search(self, card_name):
+        """Returns the card for a name in the same shape scryfall.search does, or None."""
+
+        key = fuzzy.normalize(card_name)
+        if not key:
+            return None
+        oracle_id = self._find_oracle_id(key)
+        if not oracle_id:
+            return None
+        name, color_identity, image_uris = self._conn.execute(
+            "SELECT name, color_identity, image_uris FROM cards WHERE oracle_id = ?", (oracle_id,)
+        ).fetchone()
+        return {
+            "oracle_id": oracle_id,
+            "name": name,
+            "color_identity": json.loads(color_identity),
+            "image_uris": json.loads(image_uris),
+        }
+
+    def close(self):
+        self._conn.close()
+
+def open_index(index_path, bulk_path):
+    """Opens the index at index_path, rebuilding it first if bulk_path is newer than the data
+    it was built from. The fuzzy name index is built up front so the first miss is not slow."""
+
+    index = CardIndex(index_path)
+    built_from = index.built_from()
+    if built_from is None or built_from < os.path.getmtime(bulk_path):
+        index.ingest(bulk_path)
+    index._load_fuzzy()
+    return index
@@ -1,10 +1,19 @@
+import asyncio
+import collections
+import hashlib
+import itertools
+import json
+import logging
 import time
+import weakref
 
 import discord
-from pymongo import MongoClient, DESCENDING
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, InsertOne, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
 from app.constants import status_codes as stc
 from app.constants import system
-from app.utils import utils
+from app.utils import deck_catalog, match_store, matchups, utils
 
 """PRECOND: All messages that are to be processed are received in a server rather than DM
 
@@ -32,6 +41,7 @@ Member: {
     wins: int,
     losses: int,
     deck: str,
+    recent_decks: [str],
     season_gold_badges: int,
     season_silver_badges: int,
     season_bronze_badges: int
@@ -48,12 +58,15 @@ Match: {
             name: str,
             user_id: int,
             deck: str,
+            deck_id: int,
             confirmed: bool
         }
-    ]
+    ],
+    winning_deck_id: int
 }
 
 Deck: {
+    deck_id: int,
     name: str,
     aliases: [str],
     canonical_aliases: [str],
@@ -61,9 +74,135 @@ Deck: {
     color: str,
     color_name: str
 }
+
+DeckStats: {
+    deck_id: int,
+    name: str,
+    entries: int,
+    wins: int,
+    pilots: {str(user_id): int}
+}
+
+PlayerDeckStats: {
+    user_id: int,
+    deck_id: int,
+    deck: str,
+    entries: int,
+    wins: int
+}
+
+HeadToHead: {
+    user_a: int,
+    user_b: int,
+    games: int,
+    wins_a: int,
+    wins_b: int
+}
+
+Counter: {
+    _id: str,
+    seq: int
+}
+
+AcceptedCounter: {
+    _id: "accepted",
+    total: int,
+    season: int,
+    version: int
+}
+
+RollupsMarker: {
+    _id: "rollups",
+    collections: [str],
+    schema: int
+}
+
+MigrationMarker: {
+    _id: str,
+    done: bool
+}
 """
 
-class RankDB(MongoClient):
+# Indices that every guild database should have, keyed by collection. The unique
+# game_id index is managed by migrate_game_ids since it replaces a legacy index.
+GUILD_INDICES = {
+    "members": [
+        IndexModel([("user_id", ASCENDING)]),
+        IndexModel([("pending", ASCENDING)]),
+        IndexModel([("accepted", DESCENDING)])
+    ],
+    "matches": [
+        IndexModel([("status", ASCENDING), ("timestamp", DESCENDING)]),
+        IndexModel([("players.user_id", ASCENDING), ("timestamp", DESCENDING)]),
+        IndexModel([("players.deck_id", ASCENDING), ("timestamp", DESCENDING)]),
+        IndexModel([("winning_deck_id", ASCENDING)]),
+        IndexModel([("timestamp", DESCENDING)])
+    ],
+    "seasons": [
+        IndexModel([("season_number", ASCENDING)]),
+        IndexModel([("start_time", DESCENDING)])
+    ],
+    "deck_stats": [
+        IndexModel([("deck_id", ASCENDING), ("name", ASCENDING)], unique=True)
+    ],
+    "player_deck_stats": [
+        IndexModel([("user_id", ASCENDING), ("deck_id", ASCENDING), ("deck", ASCENDING)], unique=True)
+    ],
+    "head_to_head": [
+        IndexModel([("user_a", ASCENDING), ("user_b", ASCENDING)], unique=True)
+    ]
+}
+
+# layout of the stat rollups; rollups built under an older layout are rebuilt on startup.
+# 2 groups decks by deck id rather than by name.
+ROLLUP_SCHEMA = 2
+
+# number of leaderboards kept in memory across all guilds
+LEADERBOARD_CACHE_SIZE = 256
+
+# Deck fields covered by the content hash used to diff a rescan against the stored decks
+DECK_HASH_FIELDS = ["name", "color", "color_name", "link", "aliases", "commanders"]
+
+# Member leaderboard keys that are computed from stored fields rather than stored themselves
+DERIVED_SORT_KEYS = {
+    "winrate": {
+        "$cond": [{"$gt": ["$accepted", 0]}, {"$divide": ["$wins", "$accepted"]}, 0]
+    }
+}
+
+def make_deck(color, color_name, deck_name, aliases, commanders, link=""):
+    """Builds a deck document, including the hash of its content."""
+
+    document = {
+        "name": deck_name,
+        "color": utils.sort_color_str(color),
+        "color_name": color_name,
+        "link": link,
+        "aliases": aliases,
+        "canonical_aliases": [utils.transform_deck_name(alias) for alias in aliases],
+        "commanders": commanders
+    }
+    content = json.dumps({field: document[field] for field in DECK_HASH_FIELDS}, sort_keys=True)
+    document["hash"] = hashlib.sha1(content.encode("utf-8")).hexdigest()
+    return document
+
+class RankDB(AsyncIOMotorClient):
+    def __init__(self, *args, transactions=False, match_store_budget=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        # multi-document transactions require mongodb to run as a replica set
+        self.transactions = transactions
+        self._match_locks = weakref.WeakValueDictionary()
+        self._stats_locks = weakref.WeakValueDictionary()
+        # guild id -> whether matches.game_id has a unique index, as found by migrate_game_ids
+        self._unique_game_ids = {}
+        # guild id -> whether the stat rollups are built under ROLLUP_SCHEMA
+        self._rollups_current = {}
+        self._leaderboards = collections.OrderedDict()
+        self._matchups = {}
+        # in-memory columnar copies of accepted matches, disabled without a budget in bytes
+        self._match_stores = match_store.MatchStoreCache(match_store_budget) if match_store_budget else None
+        self.deck_catalog = deck_catalog.DeckCatalog()
+
     def guild(self, guild):
         return self[str(guild.id)]
 
@@ -83,27 +222,98 @@ class RankDB(MongoClient):
         db = self.guild(guild)
         return db.seasons
 
+    def deck_stats(self, guild):
+        db = self.guild(guild)
+        return db.deck_stats
+
+    def player_deck_stats(self, guild):
+        db = self.guild(guild)
+        return db.player_deck_stats
+
+    def head_to_head(self, guild):
+        db = self.guild(guild)
+        return db.head_to_head
+
+    def counters(self, guild):
+        db = self.guild(guild)
+        return db.counters
+
     def decks(self):
         return self["decks"].decks
 
-    def setup_indices(self, guild):
-        self.members(guild).create_index("user_id")
-        self.matches(guild).create_index("game_id")
-        self.matches(guild).create_index("status")
-        self.config(guild).insert_one({
+    def deck_counters(self):
+        return self["decks"].counters
+
+    async def reconcile_indices(self, guild):
+        """Creates any indices the guild is missing. Returns a report of the indices that were
+        missing and of the existing indices that have not served a query since mongod started."""
+
+        await self.migrate_game_ids(guild)
+        db = self.guild(guild)
+        report = {"missing": [], "unused": []}
+        for collection, indices in GUILD_INDICES.items():
+            existing = await db[collection].index_information()
+            missing = [index for index in indices if index.document["name"] not in existing]
+            if missing:
+                await db[collection].create_indexes(missing)
+            report["missing"] += [f"{collection}.{index.document['name']}" for index in missing]
+            try:
+                index_stats = await db[collection].aggregate([{"$indexStats": {}}]).to_list(None)
+            except OperationFailure as e:
+                # usage figures need the indexStats privilege, which restricted users lack
+                logging.warning(f"Could not read index usage of {collection} for guild {guild.id}: {e}")
+                continue
+            report["unused"] += [
+                f"{collection}.{stat['name']}" for stat in index_stats
+                if stat["name"] != "_id_"
+                and stat["name"] not in [index.document["name"] for index in missing]
+                and stat["accesses"]["ops"] == 0
+            ]
+        return report
+
+    async def setup_indices(self, guild):
+        await self.reconcile_indices(guild)
+        await self.config(guild).insert_one({
             "admin": "",
             "player_match_threshold": 10,
             "deck_match_threshold": 10
         })
-        self.seasons(guild).insert_one({
+        await self.seasons(guild).insert_one({
             "start_time": time.time(),
             "season_number": 1
         })
+        # acceptances only write to rollups that rebuild_stats has marked as built
+        await self.backfill_stats(guild)
+
+
+    async def get_data_version(self, guild):
+        counter = await self.counters(guild).find_one({"_id": "data_version"})
+        if not counter:
+            return 0
+        return counter["seq"]
+
+    async def bump_data_version(self, guild, session=None):
+        """Marks every cached read of the guild's standings as stale."""
+
+        await self.counters(guild).update_one(
+            {"_id": "data_version"}, {"$inc": {"seq": 1}}, upsert=True, session=session)
+
+    async def get_match_version(self, guild):
+        """Returns the version of the guild's accepted matches, which moves only when a match
+        is accepted or the decks of an accepted match change. The match store and matchups
+        are keyed on it so that member and pending match writes leave them in place."""
+
+        counter = await self.counters(guild).find_one({"_id": "accepted"})
+        return counter.get("version", 0) if counter else 0
+
+    async def bump_match_version(self, guild, session=None):
+        await self.counters(guild).update_one(
+            {"_id": "accepted"}, {"$inc": {"version": 1}}, upsert=True, session=session)
 
 
     # Member methods
-    def add_member(self, user, guild):
-        if not self.find_member(user.id, guild):
+    async def add_member(self, user, guild):
+        if not await self.find_member(user.id, guild):
             document = {
                 "name": user.name,  # string
                 "user_id": user.id, # int (was string)
@@ -117,47 +327,83 @@ class RankDB(MongoClient):
                 "season_silver_badges": 0,
                 "season_bronze_badges": 0
             }
-            return self.members(guild).insert_one(document)
+            result = await self.members(guild).insert_one(document)
+            await self.bump_data_version(guild)
+            return result
         return False
 
-    def delete_member(self, user_id, guild):
-        return self.members(guild).find_one_and_delete({"user_id": user_id})
+    async def delete_member(self, user_id, guild):
+        member = await self.members(guild).find_one_and_delete({"user_id": user_id})
+        await self.bump_data_version(guild)
+        return member
+
+    async def set_member_name(self, user_id, name, guild):
+        await self.members(guild).update_one(
+            {"user_id": user_id},
+            {
+                "$set": {"name": name}
+            }
+        )
+        await self.bump_data_version(guild)
 
-    def find_member(self, user_id, guild):
-        return self.members(guild).find_one({"user_id": int(user_id)})
+    async def find_member(self, user_id, guild):
+        return await self.members(guild).find_one({"user_id": int(user_id)})
 
-    def find_members(self, query, guild, limit=0):
-        return self.members(guild).find(query, limit=limit)
+    async def find_members(self, query, guild, limit=0):
+        return await self.members(guild).find(query, limit=limit).to_list(None)
+
+    async def find_top_members_by(self, sort_key, guild, limit=0, threshold=None):
+        """Leaderboards are cached in memory until the guild's data version moves on."""
 
-    def find_top_members_by(self, sort_key, guild, limit=0, threshold=None):
         if not threshold:
-            threshold = self.get_player_match_threshold(guild)
-        if sort_key == "winrate":
-            members = self.members(guild).find(
-                {"accepted": {"$gte": threshold}})
-            members = [member for member in members]
-            results = sorted(members, key=(lambda o: o['wins']/o['accepted']), reverse=True)
-            if not limit:
-                return results
-            return results[:limit]
+            threshold, version = await asyncio.gather(
+                self.get_player_match_threshold(guild), self.get_data_version(guild))
+        else:
+            version = await self.get_data_version(guild)
+        key = (guild.id, sort_key, threshold, limit)
+        cached = self._leaderboards.get(key)
+        if cached and cached[0] == version:
+            self._leaderboards.move_to_end(key)
+            return list(cached[1])
+        members = await self._find_top_members_by(sort_key, guild, limit, threshold)
+        self._leaderboards[key] = (version, members)
+        if len(self._leaderboards) > LEADERBOARD_CACHE_SIZE:
+            self._leaderboards.popitem(last=False)
+        return list(members)
+
+    async def _find_top_members_by(self, sort_key, guild, limit, threshold):
+        if sort_key in DERIVED_SORT_KEYS:
+            pipeline = [
+                {"$match": {"accepted": {"$gte": threshold}}},
+                {"$project": {
+                    "_id": 0,
+                    "name": 1,
+                    "wins": 1,
+                    "accepted": 1,
+                    sort_key: DERIVED_SORT_KEYS[sort_key]
+                }},
+                {"$sort": {sort_key: DESCENDING}}
+            ]
+            if limit:
+                pipeline.append({"$limit": limit})
+            return await self.members(guild).aggregate(pipeline).to_list(None)
         else:
-            members = self.members(guild).find(
+            members = await self.members(guild).find(
                 {"accepted": {"$gte": threshold}}, 
                 limit=limit, sort=[(sort_key, DESCENDING)]
-            )
-            members = [member for member in members]
+            ).to_list(None)
             return members
 
-    def push_pending_match(self, game_id, user_ids, guild):
-        self.members(guild).update_many(
+    async def push_pending_match(self, game_id, user_ids, guild):
+        await self.members(guild).update_many(
             {"user_id": {"$in": user_ids}},
             {
                 "$push": {"pending": game_id}
             }
         )
     
-    def pull_pending_match(self, game_id, guild):
-        self.members(guild).update_many(
+    async def pull_pending_match(self, game_id, guild):
+        await self.members(guild).update_many(
             {"pending": game_id},
             {
                 "$pull": {"pending": game_id}
@@ -165,108 +411,193 @@ class RankDB(MongoClient):
         )
 
     # Match methods
-    def get_game_id(self, hasher, msg_id, guild):
-        while(True):
-            game_id = hasher.encode(msg_id)[:4].lower()
-            if not self.find_match(game_id, guild):
-                return game_id
-            msg_id -= 1
-
-    def add_match(self, ctx, winner, users):
-        game_id = self.get_game_id(ctx.bot.hasher, ctx.message.id, ctx.message.guild)
+    async def get_game_id(self, hasher, guild):
+        """Draws the next value from the guild's game id counter. The hasher's alphabet is
+        lowercase, so new ids never collide with each other, but legacy ids were lowercased
+        encodings of message ids and may already hold the value drawn."""
+
+        counter = await self.counters(guild).find_one_and_update(
+            {"_id": "game_id"},
+            {"$inc": {"seq": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return hasher.encode(counter["seq"])
+
+    async def migrate_game_ids(self, guild):
+        """Replaces the legacy non-unique game_id index with a unique one. Existing ids are kept as is."""
+
+        matches = self.matches(guild)
+        indices = await matches.index_information()
+        if "game_id_1" in indices:
+            if indices["game_id_1"].get("unique"):
+                self._unique_game_ids[guild.id] = True
+                return
+            await matches.drop_index("game_id_1")
+        try:
+            await matches.create_index("game_id", unique=True)
+            self._unique_game_ids[guild.id] = True
+        except OperationFailure as e:
+            logging.error(f"Could not create a unique game_id index for guild {guild.id}: {e}")
+            await matches.create_index("game_id")
+            self._unique_game_ids[guild.id] = False
+
+    async def add_match(self, ctx, winner, users):
         pending_record = {
-            "game_id": game_id,
             "status": stc.PENDING,
             "winner": winner.id,
             "winning_deck": "",
+            "winning_deck_id": None,
             "players": [
                 {
                     "user_id": user.id,
                     "name": user.name,
                     "deck": "",
+                    "deck_id": None,
                     "confirmed": False
                 } for user in users
             ],
             "timestamp": time.time(),
             "replay_link": ""
         }
-        self.matches(ctx.message.guild).insert_one(pending_record)
-        self.push_pending_match(game_id, [user.id for user in users], ctx.message.guild)
+        while(True):
+            game_id = await self.get_game_id(ctx.bot.hasher, ctx.message.guild)
+            # without the unique index nothing else stops a drawn id from reusing a legacy one
+            if not self._unique_game_ids.get(ctx.message.guild.id):
+                if await self.find_match(game_id, ctx.message.guild):
+                    continue
+            pending_record["game_id"] = game_id
+            try:
+                await self.matches(ctx.message.guild).insert_one(pending_record)
+            except DuplicateKeyError:
+                continue
+            break
+        await self.push_pending_match(game_id, [user.id for user in users], ctx.message.guild)
         return game_id
 
-    def delete_match(self, game_id, guild):
+    async def delete_match(self, game_id, guild):
         """This should only be used on unconfirmed matches."""
 
-        self.pull_pending_match(game_id, guild)
-        self.matches(guild).delete_one({"game_id": game_id})
+        await self.pull_pending_match(game_id, guild)
+        await self.matches(guild).delete_one({"game_id": game_id})
+        await self.bump_data_version(guild)
 
-    def find_match(self, game_id, guild):
-        return self.matches(guild).find_one({"game_id": game_id})
+    async def find_match(self, game_id, guild):
+        return await self.matches(guild).find_one({"game_id": game_id})
 
-    def find_matches(self, query, guild, limit=0, season=None):
+    async def find_matches(self, query, guild, limit=0, season=None):
         """season arg will return recent matches by default."""
 
         if not season:
-            return self.matches(guild).find(query, limit=limit, sort=[("timestamp", DESCENDING)])
+            cursor = self.matches(guild).find(query, limit=limit, sort=[("timestamp", DESCENDING)])
+            return await cursor.to_list(None)
         else:
-            season_info = self.get_season(guild, season)
+            season_info = await self.get_season(guild, season)
             if not season_info:
                 return None
             if "end_time" in season_info:
                 query["timestamp"] = {"$gte": season_info["start_time"], "$lt": season_info["end_time"]}
-                return self.matches(guild).find(query, limit=limit, sort=[("timestamp", DESCENDING)])
-            query["timestamp"] = {"$gte": season_info["start_time"]}
-            return self.matches(guild).find(query, limit=limit, sort=[("timestamp", DESCENDING)])
+            else:
+                query["timestamp"] = {"$gte": season_info["start_time"]}
+            cursor = self.matches(guild).find(query, limit=limit, sort=[("timestamp", DESCENDING)])
+            return await cursor.to_list(None)
 
-    def find_matches_with_deck(self, deck_name, guild, limit=0, season=None):
-        """season arg will return current season matches by default."""
+    def deck_match_query(self, deck, winning=False):
+        """Returns the match filter for games that deck was played in, or won if winning is set.
+        Decks are matched by deck id so that renames carry over; decks without one, like Rogue,
+        are matched by name."""
 
-        return self.find_matches({"players.deck": deck_name}, guild, limit, season)
+        if deck.get("deck_id") is not None:
+            return {"winning_deck_id" if winning else "players.deck_id": deck["deck_id"]}
+        return {"winning_deck" if winning else "players.deck": deck["name"]}
 
-    def find_user_matches(self, user_id, guild, limit=0):
-        return self.find_matches(
+    async def find_matches_with_deck(self, deck, guild, limit=0, season=None):
+        """season arg will return current season matches by default."""
+
+        return await self.find_matches(self.deck_match_query(deck), guild, limit, season)
+
+    async def find_deck_pilot_stats(self, deck, guild):
+        """Wins, losses and games for every player that has logged deck, most wins first.
+        Each player is named as in their most recent match with the deck."""
+
+        query = self.deck_match_query(deck)
+        pipeline = [
+            {"$match": query},
+            {"$sort": {"timestamp": DESCENDING}},
+            {"$project": {
+                "_id": 0, "winner": 1, "players.user_id": 1, "players.name": 1,
+                "players.deck": 1, "players.deck_id": 1
+            }},
+            {"$unwind": "$players"},
+            {"$match": query},
+            {"$group": {
+                "_id": "$players.user_id",
+                "name": {"$first": "$players.name"},
+                "games": {"$sum": 1},
+                "wins": {"$sum": {"$cond": [{"$eq": ["$players.user_id", "$winner"]}, 1, 0]}}
+            }},
+            {"$addFields": {"losses": {"$subtract": ["$games", "$wins"]}}},
+            {"$sort": {"wins": DESCENDING, "games": DESCENDING}}
+        ]
+        return await self.matches(guild).aggregate(pipeline).to_list(None)
+
+    async def find_user_matches(self, user_id, guild, limit=0):
+        return await self.find_matches(
             {"players.user_id": user_id}, guild, limit)
 
-    def update_match(self, query, modifier, guild):
-        return self.matches(guild).update_one(query, modifier)
+    async def update_match(self, query, modifier, guild):
+        return await self.matches(guild).update_one(query, modifier)
 
-    def count_matches(self, query, guild):
-        return self.matches(guild).count(query)
+    async def count_matches(self, query, guild):
+        return await self.matches(guild).count_documents(query)
 
-    def set_match_status(self, status, game_id, guild):
-        self.matches(guild).update_one(
+    async def set_match_status(self, status, game_id, guild):
+        await self.matches(guild).update_one(
             {"game_id": game_id},
             {
                 "$set": {"status": status}
             }
         )
 
-    def confirm_match_for_user(self, game_id, user_id, deck_name, guild):
-        match = self.find_match(game_id, guild)
+    async def confirm_match_for_user(self, game_id, user_id, deck_name, guild):
+        async with self._match_lock(game_id, guild):
+            match = await self.find_match(game_id, guild)
+            if not match:
+                return None
+            # the match lock keeps the status fixed, so only accepted matches need the stats lock
+            if match["status"] != stc.ACCEPTED:
+                return await self._set_player_deck(match, user_id, deck_name, guild)
+            # admins can change decks on accepted matches, so move the stats along with them
+            async with self._stats_lock(guild):
+                updated_match = await self._set_player_deck(match, user_id, deck_name, guild)
+                if updated_match:
+                    await self._update_match_rollups([(match, -1), (updated_match, 1)], guild)
+                    await self._replace_recent_deck(match, user_id, deck_name, guild)
+                    await self.bump_match_version(guild)
+                return updated_match
+
+    async def _set_player_deck(self, match, user_id, deck_name, guild):
+        """Confirms a player of match with deck_name. Returns the updated match."""
+
+        deck_id = await self.get_deck_id(deck_name)
+        modifier = {
+            "players.$.confirmed": True,
+            "players.$.deck": deck_name,
+            "players.$.deck_id": deck_id
+        }
         if user_id == match["winner"]:
-            return self.matches(guild).update_one(
-                {"game_id": game_id, "players.user_id": user_id},
-                {
-                    "$set": {
-                        "players.$.confirmed": True,
-                        "players.$.deck": deck_name,
-                        "winning_deck": deck_name
-                    }
-                }
-            )
-        else:
-            return self.matches(guild).update_one(
-                {"game_id": game_id, "players.user_id": user_id},
-                {
-                    "$set": {
-                        "players.$.confirmed": True,
-                        "players.$.deck": deck_name
-                    }
-                }
-            )
+            modifier["winning_deck"] = deck_name
+            modifier["winning_deck_id"] = deck_id
+        return await self.matches(guild).find_one_and_update(
+            {"game_id": match["game_id"], "players.user_id": user_id},
+            {
+                "$set": modifier
+            },
+            return_document=ReturnDocument.AFTER
+        )
 
-    def confirm_match_for_users(self, game_id, guild):
-        self.matches(guild).update_one(
+    async def confirm_match_for_users(self, game_id, guild):
+        await self.matches(guild).update_one(
             {"game_id": game_id, "players.confirmed": False},
             {
                 "$set": {
@@ -275,8 +606,8 @@ class RankDB(MongoClient):
             }
         )
 
-    def unconfirm_match_for_user(self, game_id, user_id, guild):
-        self.matches(guild).update_one(
+    async def unconfirm_match_for_user(self, game_id, user_id, guild):
+        await self.matches(guild).update_one(
             {"game_id": game_id, "players.user_id": user_id},
             {
                 "$set": {
@@ -285,62 +616,460 @@ class RankDB(MongoClient):
             }
         )
 
-    def _find_unconfirmed_player(self, players):
-        """Returns the first player that hasn't confirmed a match. Returns None if no players found."""
-
-        return next((i for i in players if not i["confirmed"]), None)
-
-    def check_match_status(self, game_id, guild):
-        match = self.find_match(game_id, guild)
-        if match["status"] == stc.ACCEPTED:
-            return False
-        if self._find_unconfirmed_player(match["players"]):
-            return False
-        # all players have confirmed the result
-        self.set_match_status(stc.ACCEPTED, game_id, guild)
-        self.members(guild).update_many({"pending": game_id}, {"$inc": {"accepted": 1}})
-        delta = self.update_scores(match, guild)
-        self.pull_pending_match(game_id, guild)
-        return delta
-
-    def update_scores(self, match, guild):
-        winner = self.find_member(match["winner"], guild)
+    def _match_lock(self, game_id, guild):
+        key = (guild.id, game_id)
+        lock = self._match_locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._match_locks[key] = lock
+        return lock
+
+    def _stats_lock(self, guild):
+        """Held by every write to the stat rollups of a guild, so that a rebuild never swaps
+        in rollups that miss an acceptance made while it ran. Taken inside a match lock."""
+
+        lock = self._stats_locks.get(guild.id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._stats_locks[guild.id] = lock
+        return lock
+
+    async def check_match_status(self, game_id, guild):
+        """Accepts the match once every player has confirmed. Returns the point changes,
+        or False if the match is not ready or has already been accepted."""
+
+        async with self._match_lock(game_id, guild), self._stats_lock(guild):
+            if not self.transactions:
+                delta, match = await self._accept_match(game_id, guild)
+            else:
+                async with await self.start_session() as session:
+                    async with session.start_transaction():
+                        delta, match = await self._accept_match(game_id, guild, session=session)
+            if match and self._match_stores:
+                self._match_stores.append(guild.id, match)
+            return delta
+
+    async def _run_writes(self, writes, session=None):
+        """Awaits independent write coroutines, concurrently unless they share a session,
+        which can only carry one operation at a time."""
+
+        if session:
+            for write in writes:
+                await write
+        else:
+            await asyncio.gather(*writes)
+
+    async def _accept_match(self, game_id, guild, session=None):
+        """Flips the match to ACCEPTED and applies the point changes to every player
+        with a single member fetch and a single ordered bulk write. The member, counter and
+        rollup writes are independent and go out together. Returns the point changes and the
+        accepted match."""
+
+        # compare-and-set on status so only one caller can ever accept a match
+        match = await self.matches(guild).find_one_and_update(
+            {
+                "game_id": game_id,
+                "status": {"$ne": stc.ACCEPTED},
+                "players.confirmed": {"$ne": False}
+            },
+            {
+                "$set": {"status": stc.ACCEPTED}
+            },
+            session=session
+        )
+        if not match:
+            return False, None
+        user_ids = [player["user_id"] for player in match["players"]]
+        members = await self.members(guild).find(
+            {"user_id": {"$in": user_ids}}, session=session).to_list(None)
+        delta, updates = self.update_scores(match, members)
+        updates += self._recent_deck_updates(match)
+        counter_updates = [
+            UpdateOne({"_id": "accepted"}, {"$inc": {"total": 1, "season": 1, "version": 1}}, upsert=True),
+            UpdateOne({"_id": "data_version"}, {"$inc": {"seq": 1}}, upsert=True)
+        ]
+        await self._run_writes([
+            self.members(guild).bulk_write(updates, ordered=True, session=session),
+            self.counters(guild).bulk_write(counter_updates, ordered=False, session=session),
+            self._update_match_rollups([(match, 1)], guild, session=session)
+        ], session=session)
+        return delta, match
+
+    def update_scores(self, match, members):
+        """Returns the point changes for a match and the member updates that apply them.
+        Each member gets one update that also counts the game and clears it from pending."""
+
+        members = {member["user_id"]: member for member in members}
+        winner = members[match["winner"]]
         losers = [
-            self.find_member(player["user_id"], guild)
+            members[player["user_id"]]
             for player in match["players"] if player["user_id"] != match["winner"]]
         gains = 0
         delta = []
+        updates = []
         for member in losers:
             avg_opponent_score = (sum([i["points"] for i in losers if i != member]) + winner["points"])/3.0
             score_diff = member["points"] - avg_opponent_score
             loss = int(round(12.0/(1+1.0065**(-score_diff)) + 4))
             gains += loss
-            self.members(guild).update_one(
+            updates.append(UpdateOne(
                 {"user_id": member["user_id"]},
                 {
                     "$inc": {
                         "points": -loss,
-                        "losses": 1
-                    }
+                        "losses": 1,
+                        "accepted": 1
+                    },
+                    "$pull": {"pending": match["game_id"]}
                 }
-            )
+            ))
             delta.append({"player": member["name"], "change": -loss})
-        self.members(guild).update_one(
+        updates.append(UpdateOne(
             {"user_id": match["winner"]},
             {
                 "$inc": {
                     "points": gains,
-                    "wins": 1
+                    "wins": 1,
+                    "accepted": 1
+                },
+                "$pull": {"pending": match["game_id"]}
+            }
+        ))
+        delta.append({"player": winner["name"], "change": gains})
+        return delta, updates
+
+    # Match stat rollups
+    def _deck_key(self, document, name_field="deck", id_field="deck_id"):
+        """Returns the deck_key of the deck named by document[name_field]. Matches the deck id
+        migration has not reached yet have their id looked up in the deck catalog."""
+
+        deck_name = document[name_field]
+        if id_field in document:
+            deck_id = document[id_field]
+        else:
+            deck_id = (self.deck_catalog.get(deck_name) or {}).get("deck_id") if deck_name else None
+        return deck_catalog.deck_key(deck_name, deck_id)
+
+    def _deck_stats_updates(self, changes):
+        """Builds the deck_stats increments for a list of (match, sign) pairs, where a sign of
+        1 adds an accepted match and -1 takes it back out. Decks are grouped by deck id, and
+        decks without one by name; matches without a confirmed deck are kept under an empty
+        name so that they still count towards the meta share."""
+
+        decks = {}
+        for match, sign in changes:
+            if match["timestamp"] <= system.deck_tracking_start_date:
+                continue
+            for player in match["players"]:
+                increments = decks.setdefault((self._deck_key(player), player["deck"]), {})
+                increments["entries"] = increments.get("entries", 0) + sign
+                pilot = f"pilots.{player['user_id']}"
+                increments[pilot] = increments.get(pilot, 0) + sign
+            winning_deck = (self._deck_key(match, "winning_deck", "winning_deck_id"), match["winning_deck"])
+            increments = decks.setdefault(winning_deck, {})
+            increments["wins"] = increments.get("wins", 0) + sign
+        updates = []
+        for (key, deck_name), increments in decks.items():
+            increments = {field: value for field, value in increments.items() if value}
+            if not increments:
+                continue
+            if isinstance(key, int):
+                updates.append(UpdateOne(
+                    {"deck_id": key}, {"$inc": increments, "$setOnInsert": {"name": deck_name}}, upsert=True))
+            else:
+                updates.append(UpdateOne({"deck_id": None, "name": key}, {"$inc": increments}, upsert=True))
+        return updates
+
+    def _player_deck_stats_updates(self, changes):
+        """Builds the player_deck_stats increments for a list of (match, sign) pairs, grouping
+        decks as _deck_stats_updates does."""
+
+        player_decks = {}
+        for match, sign in changes:
+            if match["timestamp"] <= system.deck_tracking_start_date:
+                continue
+            for player in match["players"]:
+                key = (player["user_id"], self._deck_key(player), player["deck"])
+                increments = player_decks.setdefault(key, {})
+                increments["entries"] = increments.get("entries", 0) + sign
+                if player["user_id"] == match["winner"]:
+                    increments["wins"] = increments.get("wins", 0) + sign
+        updates = []
+        for (user_id, key, deck_name), increments in player_decks.items():
+            increments = {field: value for field, value in increments.items() if value}
+            if not increments:
+                continue
+            if isinstance(key, int):
+                updates.append(UpdateOne(
+                    {"user_id": user_id, "deck_id": key},
+                    {"$inc": increments, "$setOnInsert": {"deck": deck_name}}, upsert=True))
+            else:
+                updates.append(UpdateOne(
+                    {"user_id": user_id, "deck_id": None, "deck": key}, {"$inc": increments}, upsert=True))
+        return updates
+
+    def _head_to_head_updates(self, changes):
+        """Builds the head_to_head increments for a list of (match, sign) pairs. Every pair of
+        players in a match is stored once, with the lower user id as user_a."""
+
+        pairs = {}
+        for match, sign in changes:
+            user_ids = sorted(player["user_id"] for player in match["players"])
+            for user_a, user_b in itertools.combinations(user_ids, 2):
+                increments = pairs.setdefault((user_a, user_b), {})
+                increments["games"] = increments.get("games", 0) + sign
+                if match["winner"] == user_a:
+                    increments["wins_a"] = increments.get("wins_a", 0) + sign
+                elif match["winner"] == user_b:
+                    increments["wins_b"] = increments.get("wins_b", 0) + sign
+        updates = []
+        for (user_a, user_b), increments in pairs.items():
+            increments = {key: value for key, value in increments.items() if value}
+            if increments:
+                updates.append(UpdateOne(
+                    {"user_a": user_a, "user_b": user_b}, {"$inc": increments}, upsert=True))
+        return updates
+
+    def _recent_deck_updates(self, match):
+        """Pushes each player's deck onto the rolling window of their recently played decks."""
+
+        return [
+            UpdateOne(
+                {"user_id": player["user_id"]},
+                {
+                    "$push": {
+                        "recent_decks": {
+                            "$each": [player["deck"]],
+                            "$slice": -system.recent_decks_window
+                        }
+                    }
                 }
+            ) for player in match["players"]
+        ]
+
+    async def _replace_recent_deck(self, match, user_id, deck_name, guild):
+        """Swaps the deck a player had recorded for an accepted match for deck_name in their
+        recently played decks. Nothing changes if the old deck has left the window."""
+
+        old_deck = next(player["deck"] for player in match["players"] if player["user_id"] == user_id)
+        if old_deck != deck_name:
+            await self.members(guild).update_one(
+                {"user_id": user_id, "recent_decks": old_deck},
+                {"$set": {"recent_decks.$": deck_name}}
+            )
+
+    def _rollups(self):
+        """Pairs each stat rollup collection with the function that builds its updates."""
+
+        return [
+            ("deck_stats", self._deck_stats_updates),
+            ("player_deck_stats", self._player_deck_stats_updates),
+            ("head_to_head", self._head_to_head_updates)
+        ]
+
+    async def _write_rollups(self, changes, db, suffix="", session=None):
+        writes = []
+        for collection, build_updates in self._rollups():
+            updates = build_updates(changes)
+            if updates:
+                writes.append(db[collection + suffix].bulk_write(updates, ordered=False, session=session))
+        await self._run_writes(writes, session=session)
+
+    async def _update_match_rollups(self, changes, guild, session=None):
+        # rollups under an older layout are left alone until backfill_stats rebuilds them, which
+        # picks up these matches as well
+        if await self._rollups_built(guild):
+            await self._write_rollups(changes, self.guild(guild), session=session)
+
+    async def _rollups_built(self, guild):
+        """Returns whether rebuild_stats has completely built the guild's rollups under
+        ROLLUP_SCHEMA. The answer is remembered until rebuild_stats completes."""
+
+        if guild.id not in self._rollups_current:
+            marker = await self.counters(guild).find_one({"_id": "rollups"})
+            self._rollups_current[guild.id] = bool(
+                marker and marker.get("schema") == ROLLUP_SCHEMA
+                and all(collection in marker["collections"] for collection, _ in self._rollups())
+            )
+        return self._rollups_current[guild.id]
+
+    async def _name_decks(self, deck_stats, name_field):
+        """Replaces the stored deck names in rollup documents with the current catalog names."""
+
+        if not self.deck_catalog.loaded:
+            await self.load_deck_catalog()
+        for deck_stat in deck_stats:
+            deck_stat[name_field] = self.deck_catalog.name_of(deck_stat.get("deck_id"), deck_stat[name_field])
+        return deck_stats
+
+    async def find_deck_stats(self, guild):
+        return await self._name_decks(await self.deck_stats(guild).find({}).to_list(None), "name")
+
+    async def find_player_deck_stats(self, user_id, guild):
+        return await self._name_decks(
+            await self.player_deck_stats(guild).find({"user_id": user_id}).to_list(None), "deck")
+
+    async def find_head_to_head(self, user_ids, guild):
+        """Returns the number of accepted games containing all of user_ids and each user's wins
+        in them. Pairs are read from the head_to_head rollup; larger groups are counted by an
+        aggregation over the matches that contain every user."""
+
+        if len(user_ids) == 2:
+            user_a, user_b = sorted(user_ids)
+            pair = await self.head_to_head(guild).find_one({"user_a": user_a, "user_b": user_b})
+            if not pair:
+                return {"games": 0, "wins": {user_a: 0, user_b: 0}}
+            return {
+                "games": pair["games"],
+                "wins": {user_a: pair.get("wins_a", 0), user_b: pair.get("wins_b", 0)}
             }
+        store = await self.get_match_store(guild)
+        if store:
+            return store.head_to_head(user_ids)
+        winners = await self.matches(guild).aggregate([
+            {"$match": {"status": stc.ACCEPTED, "players.user_id": {"$all": user_ids}}},
+            {"$group": {"_id": "$winner", "wins": {"$sum": 1}}}
+        ]).to_list(None)
+        wins = {winner["_id"]: winner["wins"] for winner in winners}
+        return {
+            "games": sum(wins.values()),
+            "wins": {user_id: wins.get(user_id, 0) for user_id in user_ids}
+        }
+
+    async def get_matchups(self, guild):
+        """Returns the deck-vs-deck MatchupMatrix for the league's accepted matches. The matrix
+        is kept in memory until the guild's match version or the deck catalog moves."""
+
+        await self.refresh_deck_catalog()
+        version = (await self.get_match_version(guild), self.deck_catalog.version)
+        cached = self._matchups.get(guild.id)
+        if cached and cached[0] == version:
+            return cached[1]
+        store = await self.get_match_store(guild)
+        if store:
+            matrix = store.matchups(self.deck_catalog, since=system.deck_tracking_start_date)
+        else:
+            matches = await self.matches(guild).find(
+                {"status": stc.ACCEPTED, "timestamp": {"$gt": system.deck_tracking_start_date}},
+                projection={"_id": 0, "winner": 1, "players.user_id": 1, "players.deck": 1, "players.deck_id": 1}
+            ).to_list(None)
+            matrix = matchups.build(matches, self.deck_catalog)
+        self._matchups[guild.id] = (version, matrix)
+        return matrix
+
+    async def get_match_store(self, guild):
+        """Returns the guild's MatchStore, loading it on first use or after the match version
+        has moved. Returns None when the match store is disabled."""
+
+        if not self._match_stores:
+            return None
+        version = await self.get_match_version(guild)
+        store = self._match_stores.get(guild.id, version)
+        if store:
+            return store
+        matches = await self.matches(guild).find(
+            {"status": stc.ACCEPTED},
+            projection={
+                "_id": 0, "game_id": 1, "timestamp": 1, "winner": 1,
+                "players.user_id": 1, "players.deck": 1, "players.deck_id": 1
+            },
+            sort=[("timestamp", ASCENDING)]
+        ).to_list(None)
+        store = match_store.MatchStore.load(matches, version)
+        self._match_stores.put(guild.id, store)
+        return store
+
+    async def rebuild_stats(self, guild, batch_size=1000):
+        """Recomputes the stat rollups, every member's recent decks and the accepted game counts
+        from the full match history. The rollups are built in scratch collections and swapped
+        in once complete; acceptances wait until then."""
+
+        async with self._stats_lock(guild):
+            db = self.guild(guild)
+            for collection, _ in self._rollups():
+                await db[collection + "_rebuild"].drop()
+                await db[collection + "_rebuild"].create_indexes(GUILD_INDICES[collection])
+            cursor = self.matches(guild).find(
+                {"status": stc.ACCEPTED},
+                projection={"timestamp": 1, "winner": 1, "winning_deck": 1, "winning_deck_id": 1, "players": 1},
+                sort=[("timestamp", ASCENDING)]
+            )
+            changes = []
+            recent_decks = {}
+            async for match in cursor:
+                changes.append((match, 1))
+                if match["timestamp"] > system.deck_tracking_start_date:
+                    for player in match["players"]:
+                        recent_decks.setdefault(
+                            player["user_id"], collections.deque(maxlen=system.recent_decks_window)
+                        ).append(player["deck"])
+                if len(changes) == batch_size:
+                    await self._write_rollups(changes, db, suffix="_rebuild")
+                    changes = []
+            await self._write_rollups(changes, db, suffix="_rebuild")
+            for collection, _ in self._rollups():
+                await db[collection + "_rebuild"].rename(collection, dropTarget=True)
+            if recent_decks:
+                await self.members(guild).bulk_write([
+                    UpdateOne({"user_id": user_id}, {"$set": {"recent_decks": list(decks)}})
+                    for user_id, decks in recent_decks.items()
+                ], ordered=False)
+            await self._rebuild_accepted_counts(guild)
+            await self.counters(guild).update_one(
+                {"_id": "rollups"},
+                {"$set": {"collections": [collection for collection, _ in self._rollups()], "schema": ROLLUP_SCHEMA}},
+                upsert=True
+            )
+            self._rollups_current[guild.id] = True
+
+    async def _rebuild_accepted_counts(self, guild):
+        season = await self.get_season(guild)
+        total, season_total = await asyncio.gather(
+            self.count_matches({"status": stc.ACCEPTED}, guild),
+            self.count_matches({"status": stc.ACCEPTED, "timestamp": {"$gte": season["start_time"]}}, guild)
         )
-        delta.append({"player": winner["name"], "change": gains})
-        return delta
+        await self.counters(guild).update_one(
+            {"_id": "accepted"}, {"$set": {"total": total, "season": season_total}}, upsert=True)
+
+    async def backfill_stats(self, guild):
+        """Builds the stat rollups for guilds whose rollups were never completely built by
+        rebuild_stats, which leaves a marker naming the collections it built and their layout."""
+
+        if not await self._rollups_built(guild):
+            await self.rebuild_stats(guild)
+            return
+        if not await self.counters(guild).find_one({"_id": "accepted"}):
+            await self._rebuild_accepted_counts(guild)
+
+    async def get_league_summary(self, guild):
+        """Returns the figures shown by the info command. Accepted game counts come from the
+        counters kept up to date on acceptance and open games are fetched as bare ids."""
+
+        season, accepted, open_matches, num_members = await asyncio.gather(
+            self.get_season(guild),
+            self.counters(guild).find_one({"_id": "accepted"}),
+            self.matches(guild).find(
+                {"status": {"$in": [stc.PENDING, stc.DISPUTED]}},
+                projection={"_id": 0, "game_id": 1, "status": 1},
+                sort=[("timestamp", DESCENDING)]
+            ).to_list(None),
+            self.members(guild).estimated_document_count()
+        )
+        if not accepted:
+            accepted = {}
+        return {
+            "members": num_members,
+            "season_number": season["season_number"],
+            "accepted": accepted.get("total", 0),
+            "season_accepted": accepted.get("season", 0),
+            "pending": [match["game_id"] for match in open_matches if match["status"] == stc.PENDING],
+            "disputed": [match["game_id"] for match in open_matches if match["status"] == stc.DISPUTED]
+        }
+
 
-    
     # Deck methods
-    def set_deck(self, deck_name, user, guild):
-        self.members(guild).update_one(
+    async def set_deck(self, deck_name, user, guild):
+        await self.members(guild).update_one(
             {"user_id": user.id},
             {
                 "$set": {
@@ -349,44 +1078,200 @@ class RankDB(MongoClient):
             }
         )
 
-    def add_deck(self, color, color_name, deck_name, aliases, commanders, link=""):
+    async def add_deck(self, color, color_name, deck_name, aliases, commanders, link=""):
         decks = self.decks()
-        document = {
-            "name": deck_name,
-            "color": utils.sort_color_str(color),
-            "color_name": color_name,
-            "link": link,
-            "aliases": aliases,
-            "canonical_aliases": [utils.transform_deck_name(alias) for alias in aliases],
-            "commanders": commanders
-        }
-        if not decks.find_one({"name": deck_name}):
-            decks.insert_one(document)
-            return 1
+        document = make_deck(color, color_name, deck_name, aliases, commanders, link)
+        existing = await decks.find_one({"name": deck_name}, {"deck_id": 1})
+        if not existing:
+            document["deck_id"] = (await self._reserve_deck_ids(1))[0]
+            await decks.insert_one(document)
+            added = 1
         else:
-            decks.find_one_and_replace({"name": deck_name}, document)
+            document["deck_id"] = existing.get("deck_id")
+            await decks.find_one_and_replace({"name": deck_name}, document)
+            added = 0
+        self.deck_catalog.put(document)
+        await self._deck_catalog_changed()
+        return added
+
+    async def sync_decks(self, documents, renames=None):
+        """Writes the deck documents whose content hash differs from the stored deck in one
+        bulk write. renames maps a deck name to the name it is stored under, so a renamed deck
+        replaces its stored document and keeps its deck id. Returns the number of inserted,
+        renamed, updated and unchanged decks along with the catalog version afterwards."""
+
+        stored = {
+            deck["name"]: deck
+            for deck in await self.decks().find({}, {"name": 1, "hash": 1, "deck_id": 1}).to_list(None)
+        }
+        inserts = []
+        requests = []
+        renames = renames or {}
+        report = {"inserted": 0, "renamed": 0, "updated": 0, "unchanged": 0}
+        for document in documents:
+            name = document["name"]
+            if name not in stored and renames.get(name) in stored:
+                old_name = renames[name]
+                document["deck_id"] = stored.pop(old_name).get("deck_id")
+                requests.append(ReplaceOne({"name": old_name}, document))
+                report["renamed"] += 1
+            elif name not in stored:
+                inserts.append(document)
+                report["inserted"] += 1
+            elif stored[name].get("hash") != document["hash"]:
+                document["deck_id"] = stored[name].get("deck_id")
+                requests.append(ReplaceOne({"name": name}, document))
+                report["updated"] += 1
+            else:
+                report["unchanged"] += 1
+            stored[name] = document
+        for document, deck_id in zip(inserts, await self._reserve_deck_ids(len(inserts))):
+            document["deck_id"] = deck_id
+            requests.append(InsertOne(document))
+        if requests:
+            await self.decks().bulk_write(requests, ordered=False)
+            await self.bump_deck_catalog_version()
+        await self.refresh_deck_catalog()
+        report["version"] = self.deck_catalog.version
+        return report
+
+    async def _reserve_deck_ids(self, count):
+        """Reserves count consecutive deck ids. Ids are never reused, so a deck keeps its id
+        for as long as it exists."""
+
+        if not count:
+            return []
+        counter = await self.deck_counters().find_one_and_update(
+            {"_id": "deck_id"}, {"$inc": {"seq": count}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return list(range(counter["seq"] - count + 1, counter["seq"] + 1))
+
+    async def get_deck_id(self, deck_name):
+        if not self.deck_catalog.loaded:
+            await self.load_deck_catalog()
+        deck = self.deck_catalog.get(deck_name)
+        return deck.get("deck_id") if deck else None
+
+    async def migrate_deck_ids(self):
+        """Gives every deck without one a deck id and makes deck ids unique. Runs once; decks
+        added since get their id when they are written."""
+
+        if await self.deck_counters().find_one({"_id": "deck_id_migration", "done": True}):
+            return 0
+        decks = await self.decks().find({"deck_id": None}, {"_id": 1}).sort("_id", ASCENDING).to_list(None)
+        deck_ids = await self._reserve_deck_ids(len(decks))
+        if decks:
+            await self.decks().bulk_write([
+                UpdateOne({"_id": deck["_id"]}, {"$set": {"deck_id": deck_id}})
+                for deck, deck_id in zip(decks, deck_ids)
+            ], ordered=False)
+        await self.decks().create_index("deck_id", unique=True, sparse=True)
+        await self.deck_counters().update_one(
+            {"_id": "deck_id_migration"}, {"$set": {"done": True}}, upsert=True)
+        return len(decks)
+
+    async def migrate_match_deck_ids(self, guild, batch_size=500):
+        """Records the deck id next to every deck name in matches logged before deck ids existed.
+        Work is done in batches and only matches that still lack ids are selected, so an
+        interrupted migration picks up where it stopped. Names that match no deck get a null id.
+        Once every match has ids the guild is marked as migrated and later calls return at once."""
+
+        if await self.counters(guild).find_one({"_id": "deck_id_migration", "done": True}):
             return 0
+        if not self.deck_catalog.loaded:
+            await self.load_deck_catalog()
+        migrated = 0
+        missing = {"players": {"$elemMatch": {"deck_id": {"$exists": False}}}}
+        query = missing
+        while(True):
+            matches = await self.matches(guild).find(
+                query,
+                projection={"winning_deck": 1, "players.deck": 1},
+                sort=[("_id", ASCENDING)],
+                limit=batch_size
+            ).to_list(None)
+            if not matches:
+                await self.counters(guild).update_one(
+                    {"_id": "deck_id_migration"}, {"$set": {"done": True}}, upsert=True)
+                if migrated:
+                    await self.bump_match_version(guild)
+                return migrated
+            # walk forward along _id so each batch continues the same index scan
+            query = {**missing, "_id": {"$gt": matches[-1]["_id"]}}
+            updates = []
+            for match in matches:
+                modifier = {
+                    f"players.{i}.deck_id": (self.deck_catalog.get(player["deck"]) or {}).get("deck_id")
+                    for i, player in enumerate(match["players"])
+                }
+                modifier["winning_deck_id"] = (self.deck_catalog.get(match["winning_deck"]) or {}).get("deck_id")
+                # skip matches whose decks were confirmed since they were read
+                unchanged = {f"players.{i}.deck": player["deck"] for i, player in enumerate(match["players"])}
+                updates.append(UpdateOne({"_id": match["_id"], **unchanged}, {"$set": modifier}))
+            await self.matches(guild).bulk_write(updates, ordered=False)
+            migrated += len(matches)
+
+    async def get_deck_catalog_version(self):
+        counter = await self.deck_counters().find_one({"_id": "catalog_version"})
+        return counter["seq"] if counter else 0
+
+    async def bump_deck_catalog_version(self):
+        counter = await self.deck_counters().find_one_and_update(
+            {"_id": "catalog_version"}, {"$inc": {"seq": 1}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return counter["seq"]
+
+    async def _deck_catalog_changed(self):
+        """Records a write that was already applied to the in-memory catalog."""
 
-    def remove_deck(self, deck_name):
+        self.deck_catalog.version = await self.bump_deck_catalog_version()
+
+    async def remove_deck(self, deck_name):
         decks = self.decks()
-        if not decks.find_one({"name": deck_name}):
+        if not await decks.find_one({"name": deck_name}):
             return 0
-        decks.delete_one({"name": deck_name})
+        await decks.delete_one({"name": deck_name})
+        self.deck_catalog.remove(deck_name)
+        await self._deck_catalog_changed()
         return 1
 
-    def find_deck(self, alias):
+    async def load_deck_catalog(self):
+        version = await self.get_deck_catalog_version()
+        self.deck_catalog.load(await self.decks().find({}).to_list(None), version)
+
+    async def refresh_deck_catalog(self):
+        """Reloads the deck catalog if the stored catalog version has moved past the loaded one."""
+
+        if not self.deck_catalog.loaded or await self.get_deck_catalog_version() != self.deck_catalog.version:
+            await self.load_deck_catalog()
+
+    async def find_deck(self, alias):
         if alias.lower() == "rogue":
             return {"name": "Rogue"}
-        canonical_name = utils.transform_deck_name(alias)
-        return self.decks().find_one({"canonical_aliases": canonical_name})
+        if not self.deck_catalog.loaded:
+            await self.load_deck_catalog()
+        return self.deck_catalog.find(alias)
+
+    async def resolve_deck(self, alias):
+        """Like find_deck, but tolerates typos. Returns the deck, or None along with the names
+        of the closest decks."""
+
+        if alias.lower() == "rogue":
+            return {"name": "Rogue"}, []
+        if not self.deck_catalog.loaded:
+            await self.load_deck_catalog()
+        deck, suggestions = self.deck_catalog.resolve(alias)
+        return deck, [suggestion["name"] for suggestion in suggestions]
 
-    def find_decks(self, query):
-        return self.decks().find(query)
+    async def find_decks(self, query):
+        return await self.decks().find(query).to_list(None)
 
-    def add_deck_aliases(self, alias, new_aliases):
+    async def add_deck_aliases(self, alias, new_aliases):
         canonical_name = utils.transform_deck_name(alias)
         new_canonical_aliases = list({utils.transform_deck_name(name) for name in new_aliases})
-        return self.decks().update_one({"canonical_aliases": canonical_name}, {
+        deck = await self.decks().find_one_and_update({"canonical_aliases": canonical_name}, {
             "$addToSet": {
                 "aliases": {
                     "$each": new_aliases
@@ -394,81 +1279,98 @@ class RankDB(MongoClient):
                 "canonical_aliases": {
                     "$each": new_canonical_aliases
                 }
-            }
-        })
-
-    def add_deck_link(self, alias, link):
+            },
+            "$unset": { "hash": "" }
+        }, return_document=ReturnDocument.AFTER)
+        if deck:
+            self.deck_catalog.put(deck)
+            await self._deck_catalog_changed()
+        return deck
+
+    async def add_deck_link(self, alias, link):
         canonical_name = utils.transform_deck_name(alias)
-        return self.decks().update_one({"canonical_aliases": canonical_name}, {
-            "$set": { "link": link }
-        })
-
-    def find_one_deck_by_color(self, color):
-        return self.decks().find_one({"color": utils.sort_color_str(color)})
-
-    def find_decks_by_color(self, color):
-        return self.decks().find({"color": utils.sort_color_str(color)})
-
-    def get_deck_short_name(self, alias):
-        deck = self.find_deck(alias)
-        if not deck:
-            return None
-        shortest_name = sorted(deck['aliases'], key=(lambda n: len(n)))[0]
-        return shortest_name
+        deck = await self.decks().find_one_and_update({"canonical_aliases": canonical_name}, {
+            "$set": { "link": link },
+            "$unset": { "hash": "" }
+        }, return_document=ReturnDocument.AFTER)
+        if deck:
+            self.deck_catalog.put(deck)
+            await self._deck_catalog_changed()
+        return deck
+
+    async def find_decks_by_color(self, color):
+        if not self.deck_catalog.loaded:
+            await self.load_deck_catalog()
+        return self.deck_catalog.find_by_color(color)
+
+    async def find_decks_grouped_by_color(self):
+        if not self.deck_catalog.loaded:
+            await self.load_deck_catalog()
+        return self.deck_catalog.group_by_color()
+
+    async def get_deck_short_name(self, alias):
+        if not self.deck_catalog.loaded:
+            await self.load_deck_catalog()
+        return self.deck_catalog.short_name(alias)
+
+    async def get_deck_short_names(self, aliases):
+        if not self.deck_catalog.loaded:
+            await self.load_deck_catalog()
+        return {alias: self.deck_catalog.short_name(alias) for alias in set(aliases)}
 
     # Config
-    def get_config(self, guild):
-        return self.config(guild).find_one()
+    async def get_config(self, guild):
+        return await self.config(guild).find_one()
 
-    def set_admin_role(self, role_name, guild):
-        self.config(guild).update_one({}, {
+    async def set_admin_role(self, role_name, guild):
+        await self.config(guild).update_one({}, {
             "$set": {
                 "admin": role_name
             }
         })
 
-    def get_admin_role(self, guild):
-        config = self.get_config(guild)
+    async def get_admin_role(self, guild):
+        config = await self.get_config(guild)
         if "admin" in config and config["admin"]:
             return discord.utils.find(lambda r: r.name == config["admin"], guild.roles)
         return None
 
-    def set_player_match_threshold(self, threshold, guild):
-        self.config(guild).update_one({}, {
+    async def set_player_match_threshold(self, threshold, guild):
+        await self.config(guild).update_one({}, {
             "$set": {
                 "player_match_threshold": threshold
             }
         })
 
-    def get_player_match_threshold(self, guild):
-        config = self.get_config(guild)
+    async def get_player_match_threshold(self, guild):
+        config = await self.get_config(guild)
         if "player_match_threshold" in config:
             return config["player_match_threshold"]
         return system.min_matches
 
-    def set_deck_match_threshold(self, threshold, guild):
-        self.config(guild).update_one({}, {
+    async def set_deck_match_threshold(self, threshold, guild):
+        await self.config(guild).update_one({}, {
             "$set": {
                 "deck_match_threshold": threshold
             }
         })
 
-    def get_deck_match_threshold(self, guild):
-        config = self.get_config(guild)
+    async def get_deck_match_threshold(self, guild):
+        config = await self.get_config(guild)
         if "deck_match_threshold" in config:
             return config["deck_match_threshold"]
         return system.min_matches
 
     # Seasons
-    def get_season(self, guild, season=None):
+    async def get_season(self, guild, season=None):
         seasons = self.seasons(guild)
         if not season:
-            return seasons.find({}, limit=1, sort=[("start_time", DESCENDING)])[0]
+            return await seasons.find_one({}, sort=[("start_time", DESCENDING)])
         else:
-            return seasons.find_one({"season_number": season})
+            return await seasons.find_one({"season_number": season})
 
-    def reset_scores(self, guild):
-        self.members(guild).update_many({}, 
+    async def reset_scores(self, guild):
+        await self.members(guild).update_many({}, 
             {
                 "$set": {
                     "points": system.base_points,
@@ -478,13 +1380,13 @@ class RankDB(MongoClient):
                 }
             })
 
-    def reset_season(self, guild):
+    async def reset_season(self, guild):
         # Record results from the current season
-        current_season = self.get_season(guild)
+        current_season = await self.get_season(guild)
         end_time = time.time()
-        leaders = list(self.find_top_members_by("points", guild, limit=3))
+        leaders = await self.find_top_members_by("points", guild, limit=3)
         if not leaders:
-            self.seasons(guild).update_one(
+            await self.seasons(guild).update_one(
                 {"season_number": current_season["season_number"]},
                 {
                     "$set": {
@@ -493,7 +1395,7 @@ class RankDB(MongoClient):
                 }
             )
         else:
-            self.seasons(guild).update_one(
+            await self.seasons(guild).update_one(
                 {"season_number": current_season["season_number"]},
                 {
                     "$set": {
@@ -506,17 +1408,20 @@ class RankDB(MongoClient):
         # Give season rewards
         if leaders:
             for i, badge in enumerate(["gold", "silver", "bronze"]):
-                self.members(guild).update_one(
+                await self.members(guild).update_one(
                     {"user_id": leaders[i]["user_id"]},
                     {"$inc": {f"season_{badge}_badges": 1}}
                 )
 
-        self.reset_scores(guild)
+        await self.reset_scores(guild)
+        await self.counters(guild).update_one(
+            {"_id": "accepted"}, {"$set": {"season": 0}}, upsert=True)
+        await self.bump_data_version(guild)
 
         # Create new season
         new_season = {
             "start_time": end_time,
             "season_number": current_season["season_number"]+1
         }
-        self.seasons(guild).insert_one(new_season)
+        await self.seasons(guild).insert_one(new_season)
         return current_season["season_number"], leaders
@@ -0,0 +1,115 @@
+from app.utils import fuzzy, utils
+
+# minimum similarity for a fuzzy match to be accepted without asking the user
+FUZZY_MATCH_THRESHOLD = 0.8
+# minimum similarity for a deck to be offered as a suggestion
+FUZZY_SUGGEST_THRESHOLD = 0.4
+
+def deck_key(deck_name, deck_id):
+    """Returns what a played deck is told apart by in stats: its deck id, or its name when it
+    has none, as for Rogue and decks that have left the catalog."""
+
+    return deck_id if deck_id is not None else deck_name
+
+class DeckCatalog():
+    """In-memory copy of the global decks collection. Deck documents are indexed by name,
+    canonical alias and color so that resolving a deck never needs a database query."""
+
+    def __init__(self):
+        self.loaded = False
+        self.version = 0
+        self._decks = {}
+        self._by_id = {}
+        self._by_alias = {}
+        self._by_color = {}
+        self._short_names = {}
+        self._fuzzy = fuzzy.TrigramIndex()
+
+    def load(self, decks, version=0):
+        self.version = version
+        self._decks = {deck["name"]: deck for deck in decks}
+        self._index()
+        self.loaded = True
+
+    def put(self, deck):
+        self._decks[deck["name"]] = deck
+        self._index()
+
+    def remove(self, deck_name):
+        if self._decks.pop(deck_name, None):
+            self._index()
+
+    def _index(self):
+        by_id = {}
+        by_alias = {}
+        by_color = {}
+        short_names = {}
+        fuzzy_index = fuzzy.TrigramIndex()
+        for deck in self._decks.values():
+            if deck.get("deck_id") is not None:
+                by_id[deck["deck_id"]] = deck
+            for canonical_alias in deck["canonical_aliases"]:
+                by_alias.setdefault(canonical_alias, deck)
+            by_color.setdefault(deck["color"], []).append(deck)
+            short_names[deck["name"]] = min(deck["aliases"], key=len)
+            for alias in set([deck["name"]] + deck["aliases"]):
+                fuzzy_index.add(alias, deck["name"])
+        self._by_id = by_id
+        self._by_alias = by_alias
+        self._by_color = by_color
+        self._short_names = short_names
+        self._fuzzy = fuzzy_index
+
+    def get(self, deck_name):
+        return self._decks.get(deck_name)
+
+    def get_by_id(self, deck_id):
+        return self._by_id.get(deck_id)
+
+    def name_of(self, key, default):
+        """Returns the current name of the deck a deck_key refers to, or default when the key
+        is a name or its deck has left the catalog."""
+
+        deck = self._by_id.get(key) if isinstance(key, int) else None
+        return deck["name"] if deck else default
+
+    def find(self, alias):
+        return self._by_alias.get(utils.transform_deck_name(alias))
+
+    def suggest(self, alias, limit=3):
+        """Returns up to limit (deck, score) pairs for the decks with aliases closest to alias."""
+
+        suggestions = {}
+        for deck_name, score in self._fuzzy.search(alias, limit=limit*4):
+            if score >= FUZZY_SUGGEST_THRESHOLD and deck_name not in suggestions:
+                suggestions[deck_name] = score
+        return [(self._decks[deck_name], score) for deck_name, score in suggestions.items()][:limit]
+
+    def resolve(self, alias):
+        """Returns the deck for an alias and a list of close decks. Exact alias matches are
+        preferred, then a fuzzy match that clears FUZZY_MATCH_THRESHOLD. Otherwise no deck is
+        returned and the closest decks are offered instead."""
+
+        deck = self.find(alias)
+        if deck:
+            return deck, []
+        suggestions = self.suggest(alias)
+        if suggestions and suggestions[0][1] >= FUZZY_MATCH_THRESHOLD:
+            return suggestions[0][0], []
+        return None, [deck for deck, _ in suggestions]
+
+    def find_by_color(self, color):
+        return self._by_color.get(utils.sort_color_str(color), [])
+
+    def group_by_color(self):
+        """Returns (color, decks) pairs for every color combination that has decks, in the
+        order given by utils.get_all_color_combinations."""
+
+        colors = [utils.sort_color_str(color) for color in utils.get_all_color_combinations()]
+        return [(color, self._by_color[color]) for color in colors if color in self._by_color]
+
+    def short_name(self, alias):
+        deck = self.find(alias)
+        if not deck:
+            return None
+        return self._short_names[deck["name"]]
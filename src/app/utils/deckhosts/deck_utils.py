@@ -1,11 +1,23 @@
+import asyncio
+import collections
 import logging
 import re
-import requests
+import time
+from yarl import URL
 
 from app import exceptions as err
-from app.utils import scryfall, utils
+from app.utils import http, scryfall, utils
 from app.utils.deckhosts import deckstats, tappedout, moxfield
 
+# extracted decklists kept in memory, and seconds before a hit triggers a background refresh
+DECKLIST_CACHE_SIZE = 128
+DECKLIST_TTL = 60*60
+
+_decklists = collections.OrderedDict()
+_refreshing = set()
+# the event loop only keeps weak references to tasks, so background refreshes are held here
+_refresh_tasks = set()
+
 def sort_categories(decklist):
     """Sort by number of rows so that the discord embed places
     long categories next to each other. This makes the embed more space efficient."""
@@ -19,17 +31,67 @@ def _get_color_identity(commanders):
             colors += commander["color_identity"]
     return utils.sort_color_str("".join(set(colors)))
 
-def extract(link):
+def canonical_link(link):
+    """Reduces a decklist link to host and path so that variants of the same link share a
+    cache entry."""
+
+    url = URL(link.strip())
+    host = (url.host or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return f"{host}{url.path.rstrip('/')}"
+
+def _store(key, deck):
+    _decklists[key] = (time.time(), deck)
+    _decklists.move_to_end(key)
+    if len(_decklists) > DECKLIST_CACHE_SIZE:
+        _decklists.popitem(last=False)
+
+async def _refresh(key, link):
+    try:
+        _store(key, await _extract(link))
+    except (err.DeckNotFoundError, err.CardNotFoundError):
+        logging.warning(f"Failed to refresh decklist {link}, keeping the cached copy")
+    except Exception:
+        # nobody awaits a background refresh, so anything it raises has to be logged here
+        logging.exception(f"Failed to refresh decklist {link}, keeping the cached copy")
+    finally:
+        _refreshing.discard(key)
+
+async def extract(link):
+    """Returns the parsed decklist for a link. Cached decklists are returned immediately;
+    once older than DECKLIST_TTL they are refetched in the background."""
+
+    key = canonical_link(link)
+    if key in _decklists:
+        _decklists.move_to_end(key)
+        fetched_at, deck = _decklists[key]
+        if time.time() - fetched_at >= DECKLIST_TTL and key not in _refreshing:
+            _refreshing.add(key)
+            task = asyncio.ensure_future(_refresh(key, link))
+            _refresh_tasks.add(task)
+            task.add_done_callback(_refresh_tasks.discard)
+        return deck
+    deck = await _extract(link)
+    _store(key, deck)
+    return deck
+
+async def _extract(link):
     if "tappedout" in link:
-        deck = tappedout.search(link)
+        host = tappedout
     elif "deckstats" in link:
-        deck = deckstats.search(link)
+        host = deckstats
     elif "moxfield" in link:
-        deck = moxfield.search(link)
+        host = moxfield
     else:
         raise err.DeckNotFoundError()
+    try:
+        deck = await host.search(link)
+    except http.REQUEST_ERRORS as e:
+        logging.error(e)
+        raise err.DeckNotFoundError()
 
-    commanders = [scryfall.search(cmdr_name) for cmdr_name in deck["commanders"]]
+    commanders = await asyncio.gather(*[scryfall.search(cmdr_name) for cmdr_name in deck["commanders"]])
     color_identity = _get_color_identity(commanders)
     deck["commanders"] = commanders
     deck["color_identity"] = color_identity
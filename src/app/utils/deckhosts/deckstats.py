@@ -1,7 +1,8 @@
+import logging
 import re
-import requests
 
 from app import exceptions as err
+from app.utils import http
 from app.utils.deckhosts import deck_utils
 
 def _get_card_name(line):
@@ -28,8 +29,8 @@ def _parse_decklist(dlist):
             decklist[idx]['cards'].append({"name": name, "count": int(count)})
     return deck_utils.sort_categories(decklist)
 
-def search(link):
-    r = requests.get(f"{link}?export_txt=1")
+async def search(link):
+    r = await http.get(f"{link}?export_txt=1", conditional=True)
     cmdr_names = []
     try:
         match = re.findall(r"Commander.*((\n[\w ,']*)+)", r.text)[0][0]
@@ -1,7 +1,7 @@
 import re
-import requests
 
 from app import exceptions as err
+from app.utils import http
 from app.utils.deckhosts import deck_utils
 
 TYPE_MAP = {
@@ -31,12 +31,12 @@ def _parse_decklist(decklist):
     parsed = [{"category": category, "cards": category_map[category]} for category in category_map]
     return deck_utils.sort_categories(parsed)
 
-def search(link):
+async def search(link):
     deck_id_match = re.search(r'(?<=decks\/)[\w\d_-]+', link)
     if not deck_id_match:
         return []
     deck_id = deck_id_match.group()
-    r = requests.get(f"https://api.moxfield.com/v2/decks/all/{deck_id}")
+    r = await http.get(f"https://api.moxfield.com/v2/decks/all/{deck_id}", conditional=True)
     decklist = r.json()
     if "commanders" not in decklist:
         raise err.DeckNotFoundError()
@@ -1,7 +1,8 @@
+import logging
 import re
-import requests
 
 from app import exceptions as err
+from app.utils import http
 from app.utils.deckhosts import deck_utils
 
 def _get_card_name(line):
@@ -28,12 +29,12 @@ def _parse_decklist(dlist):
             decklist[idx]['cards'].append({"name": name, "count": int(count)})
     return deck_utils.sort_categories(decklist)
 
-def search(link):
+async def search(link):
     _slug_match = re.search(r'(?<=mtg-decks/).*?(?=/)', link)
     if not _slug_match:
         return []
     slug = _slug_match.group()
-    r = requests.get(f"http://tappedout.net/mtg-decks/{slug}/?fmt=markdown")
+    r = await http.get(f"http://tappedout.net/mtg-decks/{slug}/?fmt=markdown", conditional=True)
     cmdr_names = []
     try:
         match = re.findall(r'### Commander.*((\n[*] 1.*)+)', r.text)[0][0]
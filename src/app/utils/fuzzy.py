@@ -0,0 +1,75 @@
+import heapq
+import re
+
+def normalize(text):
+    """Lower-cases text and reduces it to single-spaced runs of letters and digits."""
+
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+def edit_distance(a, b):
+    """Levenshtein distance between two strings."""
+
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j-1] + 1,
+                previous[j-1] + (char_a != char_b)
+            ))
+        previous = current
+    return previous[-1]
+
+def similarity(a, b):
+    """Edit distance scaled to a score between 0 and 1, where 1 is an exact match."""
+
+    if not a and not b:
+        return 1.0
+    return 1 - edit_distance(a, b)/max(len(a), len(b))
+
+class TrigramIndex():
+    """Inverted index from trigrams to keys. A query shortlists the keys that share the most
+    trigrams with it, then ranks the shortlist by edit distance."""
+
+    def __init__(self, shortlist_size=20):
+        self.shortlist_size = shortlist_size
+        self._keys = []
+        self._values = []
+        self._postings = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key, value):
+        normalized = normalize(key)
+        if not normalized:
+            return
+        position = len(self._keys)
+        self._keys.append(normalized)
+        self._values.append(value)
+        for gram in trigrams(normalized):
+            self._postings.setdefault(gram, []).append(position)
+
+    def search(self, query, limit=5):
+        """Returns up to limit (value, score) pairs, best match first."""
+
+        normalized = normalize(query)
+        if not normalized:
+            return []
+        shared = {}
+        for gram in trigrams(normalized):
+            for position in self._postings.get(gram, ()):
+                shared[position] = shared.get(position, 0) + 1
+        shortlist = heapq.nlargest(self.shortlist_size, shared, key=shared.get)
+        ranked = sorted(
+            ((similarity(normalized, self._keys[position]), position) for position in shortlist),
+            key=lambda o: o[0], reverse=True
+        )
+        return [(self._values[position], score) for score, position in ranked[:limit]]
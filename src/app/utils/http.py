@@ -0,0 +1,150 @@
+import asyncio
+import collections
+import json
+import logging
+import random
+
+import aiohttp
+from yarl import URL
+
+# total seconds allowed for a request, by host
+DEFAULT_TIMEOUT = 10
+HOST_TIMEOUTS = {
+    "tappedout.net": 20,
+    "deckstats.net": 15,
+    "api.moxfield.com": 15,
+    "api.scryfall.com": 10,
+}
+
+# pooled connections shared by every host, and requests allowed in flight per host
+MAX_CONNECTIONS = 32
+MAX_CONCURRENT_PER_HOST = 4
+
+# minimum seconds between the starts of consecutive requests, by host. Scryfall asks
+# clients to leave 50-100 milliseconds between requests.
+HOST_MIN_INTERVALS = {
+    "api.scryfall.com": 0.1,
+}
+
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# successful responses kept for conditional revalidation
+VALIDATED_CACHE_SIZE = 64
+
+# raised by get when a host cannot be reached after every attempt
+REQUEST_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+_session = None
+_semaphores = {}
+_next_slots = {}
+_validated = collections.OrderedDict()
+
+class Response():
+    """Body and metadata of a completed request. Mirrors the parts of requests.Response
+    that the deck hosts and Scryfall helpers use."""
+
+    def __init__(self, url, status, headers, body):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def ok(self):
+        return self.status < 400
+
+    @property
+    def text(self):
+        return self.body.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.body)
+
+def _get_session():
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=MAX_CONNECTIONS, ttl_dns_cache=300)
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+def _get_semaphore(host):
+    if host not in _semaphores:
+        _semaphores[host] = asyncio.Semaphore(MAX_CONCURRENT_PER_HOST)
+    return _semaphores[host]
+
+async def _wait_for_slot(host):
+    """Reserves the next free request slot for host and sleeps until it starts."""
+
+    interval = HOST_MIN_INTERVALS.get(host)
+    if not interval:
+        return
+    now = asyncio.get_event_loop().time()
+    slot = max(now, _next_slots.get(host, now))
+    _next_slots[host] = slot + interval
+    if slot > now:
+        await asyncio.sleep(slot - now)
+
+def _backoff(attempt, retry_after=None):
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return BACKOFF_BASE * 2**attempt + random.uniform(0, BACKOFF_BASE)
+
+async def close():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+async def get(url, params=None, headers=None, conditional=False):
+    """Fetches url through the shared session. Connection errors, timeouts and retryable
+    statuses are retried with exponential backoff; once the attempts run out the last
+    error is raised, or the last response is returned. With conditional set, the validators
+    of the last response for the url are sent and a 304 is answered with that response."""
+
+    if not conditional:
+        return await _get(url, params, headers)
+    key = (url, tuple(sorted((params or {}).items())))
+    stored = _validated.get(key)
+    headers = dict(headers or {})
+    if stored:
+        if "ETag" in stored.headers:
+            headers["If-None-Match"] = stored.headers["ETag"]
+        if "Last-Modified" in stored.headers:
+            headers["If-Modified-Since"] = stored.headers["Last-Modified"]
+    response = await _get(url, params, headers)
+    if response.status == 304 and stored:
+        _validated.move_to_end(key)
+        return stored
+    if response.status == 200 and ("ETag" in response.headers or "Last-Modified" in response.headers):
+        _validated[key] = response
+        _validated.move_to_end(key)
+        if len(_validated) > VALIDATED_CACHE_SIZE:
+            _validated.popitem(last=False)
+    return response
+
+async def _get(url, params, headers):
+    host = URL(url).host
+    timeout = aiohttp.ClientTimeout(total=HOST_TIMEOUTS.get(host, DEFAULT_TIMEOUT))
+    semaphore = _get_semaphore(host)
+    for attempt in range(MAX_ATTEMPTS):
+        retry_after = None
+        try:
+            async with semaphore:
+                await _wait_for_slot(host)
+                async with _get_session().get(url, params=params, headers=headers, timeout=timeout) as r:
+                    response = Response(str(r.url), r.status, r.headers, await r.read())
+        except REQUEST_ERRORS as e:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            logging.warning(f"GET {url} failed ({e!r}), retrying")
+        else:
+            if response.status not in RETRY_STATUSES or attempt == MAX_ATTEMPTS - 1:
+                return response
+            retry_after = response.headers.get("Retry-After")
+            logging.warning(f"GET {url} returned {response.status}, retrying")
+        await asyncio.sleep(_backoff(attempt, retry_after))
@@ -0,0 +1,187 @@
+import collections
+
+import numpy as np
+
+from app.utils import deck_catalog, matchups
+
+POD_SIZE = matchups.POD_SIZE
+
+# estimated bytes held on the Python side per game id, interned player and interned deck: the
+# objects themselves and their slots in the set, lists and dicts that hold them
+GAME_ID_BYTES = 110
+USER_BYTES = 80
+DECK_BYTES = 150
+
+class MatchStore():
+    """Accepted matches of one guild held column-wise. Player ids and decks, by deck_key, are
+    interned to small integers, with -1 marking an empty seat or a missing deck, so filters and
+    group-bys run as array operations. version is the guild match version the store reflects."""
+
+    def __init__(self, version, capacity=64):
+        self.version = version
+        self.size = 0
+        self._timestamps = np.zeros(capacity, dtype=np.float64)
+        self._players = np.full((capacity, POD_SIZE), -1, dtype=np.int32)
+        self._decks = np.full((capacity, POD_SIZE), -1, dtype=np.int32)
+        self._winners = np.full(capacity, -1, dtype=np.int8)
+        self.user_ids = []
+        self.deck_keys = []
+        # the name each interned deck was first seen under
+        self.deck_names = []
+        self._user_index = {}
+        self._deck_index = {}
+        self._game_ids = set()
+
+    @classmethod
+    def load(cls, matches, version):
+        store = cls(version, capacity=max(64, len(matches)))
+        for match in matches:
+            store.append(match)
+        return store
+
+    @property
+    def timestamps(self):
+        return self._timestamps[:self.size]
+
+    @property
+    def players(self):
+        return self._players[:self.size]
+
+    @property
+    def decks(self):
+        return self._decks[:self.size]
+
+    @property
+    def winners(self):
+        return self._winners[:self.size]
+
+    @property
+    def nbytes(self):
+        arrays = sum(array.nbytes for array in [self._timestamps, self._players, self._decks, self._winners])
+        return (
+            arrays + GAME_ID_BYTES*len(self._game_ids)
+            + USER_BYTES*len(self.user_ids) + DECK_BYTES*len(self.deck_keys)
+        )
+
+    def _grow(self):
+        capacity = 2*len(self._timestamps)
+        def resize(array, fill):
+            grown = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            grown[:len(array)] = array
+            return grown
+        self._timestamps = resize(self._timestamps, 0)
+        self._players = resize(self._players, -1)
+        self._decks = resize(self._decks, -1)
+        self._winners = resize(self._winners, -1)
+
+    def _intern(self, index, values, value):
+        if value not in index:
+            index[value] = len(values)
+            values.append(value)
+        return index[value]
+
+    def append(self, match):
+        """Adds a match to the store. Returns False if it was already there."""
+
+        # a match accepted while the store was loading can arrive a second time
+        if match["game_id"] in self._game_ids:
+            return False
+        self._game_ids.add(match["game_id"])
+        if self.size == len(self._timestamps):
+            self._grow()
+        row = self.size
+        self._timestamps[row] = match["timestamp"]
+        for seat, player in enumerate(match["players"][:POD_SIZE]):
+            self._players[row, seat] = self._intern(self._user_index, self.user_ids, player["user_id"])
+            if player["deck"]:
+                key = deck_catalog.deck_key(player["deck"], player.get("deck_id"))
+                if key not in self._deck_index:
+                    self.deck_names.append(player["deck"])
+                self._decks[row, seat] = self._intern(self._deck_index, self.deck_keys, key)
+            if player["user_id"] == match["winner"]:
+                self._winners[row] = seat
+        self.size += 1
+        return True
+
+    def containing_players(self, user_ids):
+        """Returns a mask of the matches that contain every one of user_ids."""
+
+        mask = np.ones(self.size, dtype=bool)
+        for user_id in user_ids:
+            if user_id not in self._user_index:
+                return np.zeros(self.size, dtype=bool)
+            mask &= (self.players == self._user_index[user_id]).any(axis=1)
+        return mask
+
+    def winning_players(self, mask):
+        """Returns the interned id of the winner of each selected match, or -1 if it has none."""
+
+        winners = self.winners[mask].astype(np.int64)
+        players = self.players[mask]
+        decided = winners >= 0
+        result = np.full(len(winners), -1, dtype=np.int64)
+        result[decided] = players[decided, winners[decided]]
+        return result
+
+    def head_to_head(self, user_ids):
+        """Counts the matches containing every one of user_ids and each user's wins in them."""
+
+        mask = self.containing_players(user_ids)
+        winners = self.winning_players(mask)
+        return {
+            "games": int(mask.sum()),
+            "wins": {
+                user_id: int((winners == self._user_index[user_id]).sum()) if user_id in self._user_index else 0
+                for user_id in user_ids
+            }
+        }
+
+    def matchups(self, catalog, since=None):
+        """Builds the deck-vs-deck MatchupMatrix for the matches after since, naming decks as
+        they currently are in catalog."""
+
+        mask = np.ones(self.size, dtype=bool) if since is None else self.timestamps > since
+        names = [catalog.name_of(key, name) for key, name in zip(self.deck_keys, self.deck_names)]
+        return matchups.MatchupMatrix.from_arrays(
+            names, self.decks[mask].astype(np.int64), self.winners[mask].astype(np.int64))
+
+class MatchStoreCache():
+    """Keeps the match stores of recently used guilds within a memory budget, evicting the
+    least recently used guild first."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self._stores = collections.OrderedDict()
+
+    def get(self, guild_id, version):
+        store = self._stores.get(guild_id)
+        if not store:
+            return None
+        if store.version != version:
+            del self._stores[guild_id]
+            return None
+        self._stores.move_to_end(guild_id)
+        return store
+
+    def put(self, guild_id, store):
+        self._stores[guild_id] = store
+        self._stores.move_to_end(guild_id)
+        self._evict()
+
+    def append(self, guild_id, match):
+        """Adds a newly accepted match to a loaded store and moves the store on by the one
+        version the acceptance added. A match the store already loaded leaves its version
+        behind the stored one, so a store that raced with an acceptance is reloaded by get."""
+
+        store = self._stores.get(guild_id)
+        if not store:
+            return
+        if store.append(match):
+            store.version += 1
+            self._evict()
+
+    def _evict(self):
+        total = sum(store.nbytes for store in self._stores.values())
+        while total > self.budget and len(self._stores) > 1:
+            _, store = self._stores.popitem(last=False)
+            total -= store.nbytes
@@ -0,0 +1,90 @@
+import numpy as np
+
+from app.utils import deck_catalog
+
+POD_SIZE = 4
+
+class MatchupMatrix():
+    """Deck-vs-deck results over a set of matches. games[i, j] counts the pods decks i and j
+    both played in and wins[i, j] the ones of those pods deck i won. The diagonal is zero."""
+
+    def __init__(self, decks, games, wins):
+        self.decks = decks
+        self.games = games
+        self.wins = wins
+        self._index = {deck: i for i, deck in enumerate(decks)}
+
+    @classmethod
+    def from_arrays(cls, decks, deck_ids, winners):
+        """Builds the matrices from an (n_matches, POD_SIZE) array of deck ids, with -1 for
+        empty seats and unknown decks, and an array holding each match's winning seat."""
+
+        # presence[m, d] marks deck d in match m, so a pod counts once per pair of decks in it
+        # however many seats each deck takes
+        size = len(decks)
+        rows = np.broadcast_to(np.arange(len(deck_ids))[:, None], deck_ids.shape)
+        seated = deck_ids >= 0
+        presence = np.zeros((len(deck_ids), size), dtype=np.int64)
+        presence[rows[seated], deck_ids[seated]] = 1
+
+        decided = np.nonzero(winners >= 0)[0]
+        winning_decks = deck_ids[decided, winners[decided]]
+        decided = decided[winning_decks >= 0]
+        winning = np.zeros((len(deck_ids), size), dtype=np.int64)
+        winning[decided, winning_decks[winning_decks >= 0]] = 1
+
+        games = presence.T @ presence
+        wins = winning.T @ presence
+        np.fill_diagonal(games, 0)
+        np.fill_diagonal(wins, 0)
+        return cls(decks, games, wins)
+
+    def __contains__(self, deck):
+        return deck in self._index
+
+    def against(self, deck, min_games=1):
+        """Returns (opponent, games, wins) for every deck that has shared at least min_games pods
+        with deck, most games first."""
+
+        i = self._index[deck]
+        opponents = np.nonzero(self.games[i] >= min_games)[0]
+        opponents = opponents[opponents != i]
+        opponents = opponents[np.argsort(-self.games[i, opponents], kind="stable")]
+        return [(self.decks[j], int(self.games[i, j]), int(self.wins[i, j])) for j in opponents]
+
+    def pairings(self, min_games=1, limit=None):
+        """Returns (deck_a, deck_b, games, wins_a, wins_b) for every pair of distinct decks that
+        has shared at least min_games pods, most games first."""
+
+        upper = np.triu(self.games, k=1)
+        rows, columns = np.nonzero(upper >= min_games)
+        order = np.argsort(-upper[rows, columns], kind="stable")[:limit]
+        return [
+            (
+                self.decks[i], self.decks[j], int(self.games[i, j]),
+                int(self.wins[i, j]), int(self.wins[j, i])
+            ) for i, j in zip(rows[order], columns[order])
+        ]
+
+def build(matches, catalog):
+    """Builds a MatchupMatrix from match documents. Decks are told apart by deck_catalog.deck_key
+    and named as they currently are in catalog. Players without a recorded deck take part in no
+    pairing."""
+
+    names = {}
+    for match in matches:
+        for player in match["players"]:
+            if player["deck"]:
+                key = deck_catalog.deck_key(player["deck"], player.get("deck_id"))
+                names.setdefault(key, catalog.name_of(key, player["deck"]))
+    keys = sorted(names, key=names.get)
+    index = {key: i for i, key in enumerate(keys)}
+    deck_ids = np.full((len(matches), POD_SIZE), -1, dtype=np.int64)
+    winners = np.full(len(matches), -1, dtype=np.int64)
+    for row, match in enumerate(matches):
+        for seat, player in enumerate(match["players"][:POD_SIZE]):
+            if player["deck"]:
+                deck_ids[row, seat] = index[deck_catalog.deck_key(player["deck"], player.get("deck_id"))]
+            if player["user_id"] == match["winner"]:
+                winners[row] = seat
+    return MatchupMatrix.from_arrays([names[key] for key in keys], deck_ids, winners)
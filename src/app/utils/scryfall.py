@@ -1,18 +1,64 @@
-import requests
+import logging
 
 from app import exceptions as err
+from app.utils import card_cache, http
 
-def search(card_name):
+_cache = card_cache.CardCache()
+_index = None
+
+def set_card_cache(cache):
+    global _cache
+    _cache.close()
+    _cache = cache
+
+def set_card_index(index):
+    """Answers searches from a local bulk-data index before the cache and the API."""
+
+    global _index
+    _index = index
+
+def _slim(card):
+    """Keeps only the card fields the bot reads, with image URIs resolved up front."""
+
+    return {
+        "oracle_id": card.get("oracle_id"),
+        "name": card["name"],
+        "color_identity": card["color_identity"],
+        "image_uris": get_image_uris(card),
+    }
+
+async def _fetch(card_name):
     try:
         params = {"fuzzy": card_name}
-        r = requests.get("https://api.scryfall.com/cards/named", params=params)
+        r = await http.get("https://api.scryfall.com/cards/named", params=params)
     except Exception as e:
         logging.error(e)
         raise err.CardNotFoundError()
-    else:
-        return r.json()
+    if not r.ok:
+        raise err.CardNotFoundError()
+    return r.json()
+
+async def search(card_name):
+    """Returns a card from the cache, going to Scryfall only for unknown or expired names.
+    An expired card is still served if Scryfall cannot be reached."""
+
+    if _index:
+        card = _index.search(card_name)
+        if card:
+            return card
+    card, fresh = await _cache.get(card_name)
+    if fresh:
+        return card
+    try:
+        fetched = _slim(await _fetch(card_name))
+    except err.CardNotFoundError:
+        if card:
+            return card
+        raise
+    await _cache.put(card_name, fetched)
+    return fetched
 
 def get_image_uris(card):
-    if "card_faces" in card:
-        return card['card_faces'][0]['image_uris']
-    return card['image_uris']
+    if "image_uris" in card:
+        return card['image_uris']
+    return card['card_faces'][0]['image_uris']
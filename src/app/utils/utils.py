@@ -2,8 +2,6 @@ from datetime import datetime
 import re
 import statsmodels.stats.proportion as stats
 
-from app.constants import status_codes as stc
-from app.constants import system
 from app.utils import embed, line_table
 
 DEFAULT_LIMIT = 10
@@ -37,63 +35,55 @@ def get_command_arg(args, key, default):
     return default
 
 # deck data processing
-def get_match_stats(ctx):
-    matches = ctx.bot.db.find_matches(
-        {
-            "timestamp": {"$gt": system.deck_tracking_start_date}, 
-            "status": stc.ACCEPTED
-        }, ctx.message.guild)
-    if not matches:
+async def get_match_stats(ctx):
+    deck_stats = await ctx.bot.db.find_deck_stats(ctx.message.guild)
+    if not deck_stats:
         return None
-    return process_match_stats(ctx, matches)
-
-def get_player_match_stats(ctx, user):
-    matches = ctx.bot.db.find_matches(
-        {
-            "timestamp": {"$gt": system.deck_tracking_start_date},
-            "status": stc.ACCEPTED,
-            "players.user_id": user.id
-        }, ctx.message.guild
-    )
-    if not matches:
+    return await process_match_stats(ctx, deck_stats)
+
+async def get_player_match_stats(ctx, user):
+    deck_stats = await ctx.bot.db.find_player_deck_stats(user.id, ctx.message.guild)
+    if not deck_stats:
         return None
-    return process_player_match_stats(ctx, user, matches)
+    return await process_player_match_stats(ctx, deck_stats)
 
-def get_deck_short_name(ctx, deck_name, cache):
+async def get_deck_short_name(ctx, deck_name, cache):
     if not deck_name:
         return "Unknown"
     if len(deck_name) <= 18:
         # already short enough
         return deck_name
     if deck_name not in cache:
-        deck_short_name = ctx.bot.db.get_deck_short_name(deck_name)
+        deck_short_name = await ctx.bot.db.get_deck_short_name(deck_name)
         if not deck_short_name:
             cache[deck_name] = deck_name
             return deck_name
-        cache[deck_name] = ctx.bot.db.get_deck_short_name(deck_name)
+        cache[deck_name] = deck_short_name
     return cache[deck_name]
 
-def process_match_stats(ctx, matches):
+async def process_match_stats(ctx, deck_stats):
+    """Merges the stored per deck rollups by short name and derives win % and meta share."""
+
     decks = {}
     name_cache = {}
-    for match in matches:
-        for player in match["players"]:
-            deck_name = player["deck"]
-            deck_name = get_deck_short_name(ctx, deck_name, name_cache)
-            if deck_name in decks:
-                decks[deck_name]["entries"] += 1
-                decks[deck_name]["players"].add(player["user_id"])
-            else:
-                decks[deck_name] = {
-                    "name": deck_name,
-                    "entries": 1,
-                    "players": {player["user_id"]},
-                    "wins": 0
-                }
-        winning_deck = get_deck_short_name(ctx, match["winning_deck"], name_cache)
-        decks[winning_deck]["wins"] += 1
+    for deck_stat in deck_stats:
+        if deck_stat.get("entries", 0) <= 0:
+            continue
+        deck_name = await get_deck_short_name(ctx, deck_stat["name"], name_cache)
+        pilots = {int(user_id) for user_id, games in deck_stat.get("pilots", {}).items() if games > 0}
+        if deck_name in decks:
+            decks[deck_name]["entries"] += deck_stat["entries"]
+            decks[deck_name]["wins"] += deck_stat.get("wins", 0)
+            decks[deck_name]["players"] |= pilots
+        else:
+            decks[deck_name] = {
+                "name": deck_name,
+                "entries": deck_stat["entries"],
+                "players": pilots,
+                "wins": deck_stat.get("wins", 0)
+            }
     total_entries = sum([decks[deck_name]['entries'] for deck_name in decks])
-    deck_match_threshold = ctx.bot.db.get_deck_match_threshold(ctx.message.guild)
+    deck_match_threshold = await ctx.bot.db.get_deck_match_threshold(ctx.message.guild)
     list_decks = [decks[i] for i in decks if (i != "Unknown" and decks[i]["entries"] >= deck_match_threshold)]
     for deck in list_decks:
         deck["winrate"] = deck["wins"]/deck["entries"]
@@ -101,20 +91,21 @@ def process_match_stats(ctx, matches):
         deck["losses"] = deck["entries"] - deck["wins"]
     return list_decks
 
-def process_player_match_stats(ctx, user, matches):
+async def process_player_match_stats(ctx, deck_stats):
     decks = {}
     name_cache = {}
-    for match in matches:
-        deck_name = get_player_deck(user.id, match)
-        deck_name = get_deck_short_name(ctx, deck_name, name_cache)
+    for deck_stat in deck_stats:
+        if deck_stat.get("entries", 0) <= 0:
+            continue
+        deck_name = await get_deck_short_name(ctx, deck_stat["deck"], name_cache)
         if deck_name in decks:
-            decks[deck_name]["entries"] += 1
-            decks[deck_name]["wins"] += 1 if match["winner"] == user.id else 0
+            decks[deck_name]["entries"] += deck_stat["entries"]
+            decks[deck_name]["wins"] += deck_stat.get("wins", 0)
         else:
             decks[deck_name] = {
                 "name": deck_name,
-                "entries": 1,
-                "wins": 1 if match["winner"] == user.id else 0
+                "entries": deck_stat["entries"],
+                "wins": deck_stat.get("wins", 0)
             }
     list_decks = decks.values()
     for deck in list_decks:
@@ -157,10 +148,18 @@ def transform_deck_name(deck_name):
     letters_only = re.search(r"([a-z]*)$", sorted_name).group()
     return letters_only
 
-def get_appearances(match, deck_name):
-    """Counts the number of times deck_name shows up in a match"""
+def is_deck(deck, deck_name, deck_id):
+    """Checks whether a deck recorded on a match is deck. Decks with an id are compared by id
+    so that renamed decks still match; decks without one, like Rogue, by name."""
 
-    return sum([1 if player["deck"] == deck_name else 0
+    if deck.get("deck_id") is not None:
+        return deck_id == deck["deck_id"]
+    return deck_name == deck["name"]
+
+def get_appearances(match, deck):
+    """Counts the number of times deck shows up in a match"""
+
+    return sum([1 if is_deck(deck, player["deck"], player.get("deck_id")) else 0
         for player in match['players']])
 
 def confint_95(success, samples):
@@ -187,13 +186,24 @@ def get_winner_name(match):
 def get_player_deck(user_id, match):
     return next((i['deck'] for i in match['players'] if i['user_id'] == user_id), "N/A")
 
-def shorten_deck_name(ctx, name, maxlen=16):
-    if len(name) <= maxlen:
-        return name
-    shortened = ctx.bot.db.get_deck_short_name(name)
-    if len(shortened) <= maxlen:
-        return shortened
-    return shortened[:(maxlen-3)] + "..."
+async def shorten_deck_names(ctx, names, maxlen=16):
+    """Shortens every distinct deck name in names, looking up all short names in one batch.
+    Returns a dict from each name to its shortened form."""
+
+    long_names = {name for name in names if name and len(name) > maxlen}
+    short_names = await ctx.bot.db.get_deck_short_names(long_names) if long_names else {}
+    shortened = {name: name for name in names}
+    for name in long_names:
+        short_name = short_names.get(name) or name
+        if len(short_name) > maxlen:
+            short_name = short_name[:(maxlen-3)] + "..."
+        shortened[name] = short_name
+    return shortened
+
+def did_you_mean(suggestions):
+    if not suggestions:
+        return ""
+    return " Did you mean " + " or ".join([f"**{name}**" for name in suggestions]) + "?"
 
 def shorten_player_name(name, maxlen=16):
     if len(name) <= maxlen:
@@ -217,16 +227,3 @@ def make_leaderboard_table(players, key, title):
     if not rows:
         return None
     return line_table.LineTable(rows, title=title)
-
-def player_accumulator(A, B):
-    for player in B["players"]:
-        if player["deck"] == A["deck_name"]:
-            if player["user_id"] not in A["data"]:
-                A["data"][player["user_id"]] = {"name": player["name"], "wins": 0, "losses": 0, "games": 1}
-            else:
-                A["data"][player["user_id"]]["games"] += 1
-            if player["user_id"] == B["winner"]:
-                A["data"][player["user_id"]]["wins"] += 1
-            else:
-                A["data"][player["user_id"]]["losses"] += 1
-    return A